@@ -1,9 +1,20 @@
+import csv
 import itertools
-import subprocess
+import multiprocessing
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "simulations"))
+import factorialExperiment
+import resultStore
+import sketch
+import sweep
+
+# Usage: python factorial.py <uniqId> [numWorkers]
 uniqId = sys.argv[1]
+numWorkers = int(sys.argv[2]) if len(sys.argv) > 2 \
+    else multiprocessing.cpu_count()
 
 numClients = [150, 300]
 numServers = [50]
@@ -21,6 +32,7 @@ cubicC = [0.000004]
 cubicSmax = [10]
 cubicBeta = [0.2]
 hysterisisFactor = [2]
+rateController = ["cubic"]
 shadowReadRatio = [0.1]
 accessPattern = ["uniform"]
 nwLatencyBase = [2.0]
@@ -64,6 +76,7 @@ LIST = [numClients,
         cubicSmax,
         cubicBeta,
         hysterisisFactor,
+        rateController,
         shadowReadRatio,
         accessPattern,
         nwLatencyBase,
@@ -82,121 +95,73 @@ LIST = [numClients,
         ]
 PARAM_COMBINATIONS = list(itertools.product(*LIST))
 
-print len(PARAM_COMBINATIONS)
+PARAM_NAMES = ["numClients", "numServers", "numWorkload",
+               "workloadModel", "serverConcurrency",
+               "serviceTime", "utilization",
+               "serviceTimeModel", "replicationFactor", "selectionStrategy",
+               "rateInterval", "cubicC", "cubicSmax",
+               "cubicBeta", "hysterisisFactor", "rateController",
+               "shadowReadRatio",
+               "accessPattern", "nwLatencyBase",
+               "nwLatencyMu", "nwLatencySigma",
+               "simulationDuration", "seed",
+               "numRequests", "expScenario",
+               "demandSkew", "highDemandFraction",
+               "slowServerFraction",
+               "slowServerSlowness", "intervalParam",
+               "timeVaryingDrift"]
 
 basePath = os.getcwd()
 
-for combination in PARAM_COMBINATIONS:
-        numClients, numServers, numWorkload, \
-            workloadModel, serverConcurrency, \
-            serviceTime, utilization, \
-            serviceTimeModel, replicationFactor, selectionStrategy, \
-            rateInterval, cubicC, cubicSmax, \
-            cubicBeta, hysterisisFactor, shadowReadRatio, \
-            accessPattern, nwLatencyBase, \
-            nwLatencyMu, nwLatencySigma, \
-            simulationDuration, seed, \
-            numRequests, expScenario, \
-            demandSkew, highDemandFraction, \
-            slowServerFraction, \
-            slowServerSlowness, intervalParam, \
-            timeVaryingDrift, = combination
-
-        os.chdir(basePath + "/simulations")
-        backpressure = ""
-
-        if (selectionStrategy == "expDelay"):
-            backpressure = "--backpressure"
-
-        cmd = "python factorialExperiment.py \
-                --numClients %s\
-                --numServers %s\
-                --numWorkload %s\
-                --workloadModel %s\
-                --serverConcurrency %s\
-                --serviceTime %s\
-                --utilization %s\
-                --serviceTimeModel %s\
-                --replicationFactor %s\
-                --selectionStrategy %s \
-                --shadowReadRatio %s\
-                --rateInterval %s\
-                --cubicC %s\
-                --cubicSmax %s\
-                --cubicBeta %s\
-                --hysterisisFactor %s\
-                --accessPattern %s\
-                --nwLatencyBase %s\
-                --nwLatencyMu %s\
-                --nwLatencySigma %s\
-                --expPrefix %s\
-                --simulationDuration %s\
-                --seed %s\
-                --numRequests %s\
-                --expScenario %s\
-                --demandSkew %s\
-                --highDemandFraction %s\
-                --slowServerFraction %s\
-                --slowServerSlowness %s\
-                --intervalParam %s\
-                --timeVaryingDrift %s\
-                --logFolder %s %s"\
-                  % (numClients,
-                     numServers,
-                     numWorkload,
-                     workloadModel,
-                     serverConcurrency,
-                     serviceTime,
-                     utilization,
-                     serviceTimeModel,
-                     replicationFactor,
-                     selectionStrategy,
-                     shadowReadRatio,
-                     rateInterval,
-                     cubicC,
-                     cubicSmax,
-                     cubicBeta,
-                     hysterisisFactor,
-                     accessPattern,
-                     nwLatencyBase,
-                     nwLatencyMu,
-                     nwLatencySigma,
-                     selectionStrategy,
-                     simulationDuration,
-                     seed,
-                     numRequests,
-                     expScenario,
-                     demandSkew,
-                     highDemandFraction,
-                     slowServerFraction,
-                     slowServerSlowness,
-                     intervalParam,
-                     timeVaryingDrift,
-                     logFolder,
-                     backpressure)
-        proc = subprocess.Popen(cmd.split(),
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        out, err = proc.communicate()
-
-        if (proc.returncode != 0):
-            print ' '.join(map(lambda x: str(x), combination)) + " ERROR"
-        else:
-            os.chdir(basePath + "/plotting")
-            cmd = "Rscript factorialResults.r %s %s"\
-                % (selectionStrategy, logFolder)
-            proc = subprocess.Popen(cmd.split(),
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
-            out, err = proc.communicate()
-            for line in out.split("\n"):
-                if (selectionStrategy in line):
-                    parts = line.split()
-                    for i in range(len(parts)):
-                        parts[i] = parts[i][1:-1]
-                    print ' '.join(map(lambda x: str(x), combination))\
-                        + " " + ' '.join(parts)
-                    sys.stdout.flush()
-        os.chdir(basePath)
+# Summaries of completed runs, shared by every sweep started from here
+store = resultStore.ResultStore(os.path.join(basePath, "results"))
+
+
+def runCombination(combination):
+        """Runs one combination, in this worker, unless it is in the
+           store already. Returns its prefix and latency summary."""
+        params = dict(zip(PARAM_NAMES, combination))
+        selectionStrategy = params["selectionStrategy"]
+
+        config = factorialExperiment.config(
+            logFolder=os.path.join(basePath, logFolder),
+            backpressure=(selectionStrategy == "expDelay"),
+            **params)
+        # Runs go on concurrently, so each gets its own prefix. It is
+        # derived from the run's key, so that a resumed sweep finds the
+        # logs of the runs it skips.
+        config.expPrefix = "%s-%s" % (selectionStrategy,
+                                      resultStore.key(config)[:12])
+        return config.expPrefix, sweep.runPoint(config, store)
+
+
+if __name__ == '__main__':
+        print len(PARAM_COMBINATIONS)
+
+        # One row per combination, with its latency summary
+        summaryFile = open(os.path.join(logFolder, "summary.csv"), 'w')
+        writer = csv.writer(summaryFile)
+        writer.writerow(PARAM_NAMES + ["expPrefix"]
+                        + list(sketch.SUMMARY_COLUMNS))
+
+        # Combinations run concurrently, in long-lived workers, but their
+        # results are printed in combination order
+        pool = sweep.pool(numWorkers)
+        for combination, (expPrefix, summary) in \
+                zip(PARAM_COMBINATIONS,
+                    pool.imap(runCombination, PARAM_COMBINATIONS)):
+                params = ' '.join(map(lambda x: str(x), combination))
+                if (summary is None):
+                        print params + " ERROR"
+                        continue
+                row = sketch.summaryRow(summary)
+                writer.writerow(list(combination) + [expPrefix] + row)
+                summaryFile.flush()
+                # The columns factorialResults.r used to print
+                print params + " " + expPrefix + " " \
+                    + ' '.join(str(summary["all"].get(q))
+                               for q in ["p50", "p95", "p99"])
+                sys.stdout.flush()
+        pool.close()
+        pool.join()
+        summaryFile.close()
@@ -1,11 +1,18 @@
-import SimPy.Simulation as Simulation
+import bisect
+import collections
+import kernel
 import random
-import numpy
+import array
 import constants
 import task
 import math
-
-from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+import sampler
+import monitors
+import sketch
+import replicaSelection
+import congestionControl
+import placement as placementModule
+import keyspace
 
 
 class Client():
@@ -13,50 +20,93 @@ class Client():
                  accessPattern, replicationFactor, backpressure,
                  shadowReadRatio, rateInterval,
                  cubicC, cubicSmax, cubicBeta, hysterisisFactor,
-                 demandWeight):
+                 demandWeight, placement=None, keySpace=None,
+                 nwLatencyBase=constants.NW_LATENCY_BASE,
+                 nwLatencyMu=constants.NW_LATENCY_MU,
+                 nwLatencySigma=constants.NW_LATENCY_SIGMA,
+                 numClients=constants.NUMBER_OF_CLIENTS,
+                 summaryWarmup=constants.SUMMARY_WARMUP,
+                 rateController=constants.RATE_CONTROLLER,
+                 additiveIncrease=constants.ADDITIVE_INCREASE,
+                 vegasAlpha=constants.VEGAS_ALPHA,
+                 vegasBeta=constants.VEGAS_BETA):
         self.id = id_
         self.serverList = serverList
         self.accessPattern = accessPattern
         self.replicationFactor = replicationFactor
+        # Usually built once per run and shared by all clients
+        if (placement is None):
+            placement = placementModule.RingPlacement(serverList,
+                                                      replicationFactor)
+        self.placement = placement
+        # Uniform access needs no key space, any other access pattern
+        # draws partitions from one (again, usually shared)
+        if (keySpace is None and accessPattern != "uniform"):
+            keySpace = keyspace.KeySpace("keys-%s" % id_, placement,
+                                         accessPattern)
+        self.keySpace = keySpace
+        self.nwLatencyBase = nwLatencyBase
+        self.nwLatencyMu = nwLatencyMu
+        self.nwLatencySigma = nwLatencySigma
+        self.numClients = numClients
+        # Latencies of requests completing before this time (ms) are left
+        # out of latencySketch
+        self.summaryWarmup = summaryWarmup
         self.REPLICA_SELECTION_STRATEGY = replicaSelectionStrategy
-        self.pendingRequestsMonitor = Simulation.Monitor(name="PendingRequests")
-        self.latencyTrackerMonitor = Simulation.Monitor(name="ResponseHandler")
-        self.rateMonitor = Simulation.Monitor(name="AlphaMonitor")
-        self.receiveRateMonitor = Simulation.Monitor(name="ReceiveRateMonitor")
-        self.tokenMonitor = Simulation.Monitor(name="TokenMonitor")
-        self.edScoreMonitor = Simulation.Monitor(name="edScoreMonitor")
+        if (replicaSelectionStrategy not in replicaSelection.STRATEGIES):
+            raise ValueError("Unknown replica selection strategy: %s"
+                             % replicaSelectionStrategy)
+        if (rateController not in congestionControl.CONTROLLERS):
+            raise ValueError("Unknown rate controller: %s" % rateController)
+        self.pendingRequestsMonitor = monitors.Monitor("PendingRequests", id_)
+        self.latencyTrackerMonitor = monitors.Monitor("LatencyTracker", id_)
+        self.rateMonitor = monitors.Monitor("Rate", id_)
+        self.receiveRateMonitor = monitors.Monitor("ReceiveRate", id_)
+        self.tokenMonitor = monitors.Monitor("Tokens", id_)
+        self.edScoreMonitor = monitors.Monitor("EdScore", id_)
+        self.latencySketch = sketch.QuantileSketch()
+        # The same latencies, by task priority class
+        self.classSketches = collections.defaultdict(sketch.QuantileSketch)
+        self.latencyWindows = monitors.Windowed("LatencyWindows", id_)
+        self.rateWindows = monitors.Windowed("RateWindows", id_)
         self.backpressure = backpressure    # True/Flase
         self.shadowReadRatio = shadowReadRatio
         self.demandWeight = demandWeight
+        self.nwLatencySampler = sampler.standardNormal("nw-%s" % id_)
 
         # Book-keeping and metrics to be recorded follow...
 
+        # Per-replica state is kept in arrays indexed by server id:
+        # array columns, whose items read and write as plain numbers
+        numSlots = max(node.id for node in serverList) + 1
+
         # Number of outstanding requests at the client
-        self.pendingRequestsMap = {node: 0 for node in serverList}
+        self.pendingRequests = array.array("l", [0]) * numSlots
 
         # Number of outstanding requests times oracle-service time of replica
-        self.pendingXserviceMap = {node: 0 for node in serverList}
+        self.pendingXservice = array.array("d", [0.0]) * numSlots
 
         # Last-received response time of server
-        self.responseTimesMap = {node: 0 for node in serverList}
+        self.responseTimes = array.array("d", [0.0]) * numSlots
 
         # Used to track response time from the perspective of the client
         self.taskSentTimeTracker = {}
         self.taskArrivalTimeTracker = {}
 
-        # Record waiting and service times as relayed by the server
-        self.expectedDelayMap = {node: {} for node in serverList}
-        self.lastSeen = {node: 0 for node in serverList}
+        # Last time a response was received from each server
+        self.lastSeen = array.array("d", [0.0]) * numSlots
+
+        # Bumped whenever what the client knows of a replica (its
+        # pending requests and response feedback) changes, so that a
+        # replica order worked out from it can be reused until then
+        self.feedbackVersions = [0] * numSlots
 
         # Rate limiters per replica
         self.rateLimiters = {node: RateLimiter("RL-%s" % node.id,
                                                self, 50, rateInterval)
                              for node in serverList}
-        self.lastRateDecrease = {node: 0 for node in serverList}
-        self.valueOfLastDecrease = {node: 10 for node in serverList}
         self.receiveRate = {node: ReceiveRate("RL-%s" % node.id, rateInterval)
                             for node in serverList}
-        self.lastRateIncrease = {node: 0 for node in serverList}
         self.rateInterval = rateInterval
 
         # Parameters for congestion control
@@ -64,393 +114,298 @@ class Client():
         self.cubicSmax = cubicSmax
         self.cubicBeta = cubicBeta
         self.hysterisisFactor = hysterisisFactor
+        self.additiveIncrease = additiveIncrease
+        self.vegasAlpha = vegasAlpha
+        self.vegasBeta = vegasBeta
+        self.controller = \
+            congestionControl.CONTROLLERS[rateController](self)
 
         # Backpressure related initialization
         if (backpressure is True):
             self.backpressureSchedulers = \
                 {node: BackpressureScheduler("BP-%s" % node.id, self)
                  for node in serverList}
-            for node in serverList:
-                Simulation.activate(self.backpressureSchedulers[node],
-                                    self.backpressureSchedulers[node].run(),
-                                    at=Simulation.now())
-
-        # ds-metrics
-        if (replicaSelectionStrategy == "ds"):
-            self.latencyEdma = {node: ExponentiallyDecayingSample(100,
-                                                                  0.75,
-                                                                  self.clock)
-                                for node in serverList}
-            self.dsScores = {node: 0 for node in serverList}
-            for node, rateLimiter in self.rateLimiters.items():
-                ds = DynamicSnitch(self, 100)
-                Simulation.activate(ds, ds.run(),
-                                    at=Simulation.now())
-
-    def clock(self):
-        '''
-            Convert to seconds because that's what the
-            ExponentiallyDecayingSample
-            assumes. Else, the internal Math.exp overflows.
-        '''
-        return Simulation.now()/1000.0
+
+        # Chosen once; the strategy keeps any state of its own
+        self.strategy = \
+            replicaSelection.STRATEGIES[replicaSelectionStrategy](self)
 
     def schedule(self, task, replicaSet=None):
         replicaToServe = None
-        firstReplicaIndex = None
-
-        # Pick a random node and it's next RF - 1 number of neighbours
-        if (self.accessPattern == "uniform"):
-            firstReplicaIndex = random.randint(0, len(self.serverList) - 1)
-        elif(self.accessPattern == "zipfian"):
-            firstReplicaIndex = numpy.random.zipf(1.5) % len(self.serverList)
 
+        # Pick a random partition, and with it its replicas
         if (replicaSet is None):
-            replicaSet = [self.serverList[i % len(self.serverList)]
-                          for i in range(firstReplicaIndex,
-                                         firstReplicaIndex +
-                                         self.replicationFactor)]
-        startTime = Simulation.now()
+            if (self.keySpace is None):
+                replicaSet = self.placement.randomReplicaSet()
+            else:
+                replicaSet = self.keySpace.nextReplicaSet()
+        startTime = kernel.now()
         self.taskArrivalTimeTracker[task] = startTime
 
         if(self.backpressure is False):
-            sortedReplicaSet = self.sort(replicaSet)
+            sortedReplicaSet = self.strategy.select(replicaSet)
             replicaToServe = sortedReplicaSet[0]
             self.sendRequest(task, replicaToServe)
             self.maybeSendShadowReads(replicaToServe, replicaSet)
         else:
-            self.backpressureSchedulers[replicaSet[0]].enqueue(task, replicaSet)
+            self.backpressureSchedulers[replicaSet[0]].enqueue(task,
+                                                               replicaSet)
+
+    def networkDelay(self):
+        delay = self.nwLatencyBase + self.nwLatencyMu
+        if (self.nwLatencySigma != 0):
+            delay += self.nwLatencySigma \
+                * self.nwLatencySampler.next()
+        return delay
 
     def sendRequest(self, task, replicaToServe):
-        delay = constants.NW_LATENCY_BASE + \
-            random.normalvariate(constants.NW_LATENCY_MU,
-                                 constants.NW_LATENCY_SIGMA)
+        delay = self.networkDelay()
 
         # Immediately send out request
-        messageDeliveryProcess = DeliverMessageWithDelay()
-        Simulation.activate(messageDeliveryProcess,
-                            messageDeliveryProcess.run(task,
-                                                       delay,
-                                                       replicaToServe),
-                            at=Simulation.now())
-
-        responseHandler = ResponseHandler()
-        Simulation.activate(responseHandler,
-                            responseHandler.run(self, task, replicaToServe),
-                            at=Simulation.now())
+        task.completionHandler = self.onTaskComplete
+        task.replica = replicaToServe
+        kernel.schedule(delay, replicaToServe.enqueueTask, task)
 
         # Book-keeping for metrics
-        self.pendingRequestsMap[replicaToServe] += 1
-        self.pendingXserviceMap[replicaToServe] = \
-            (1 + self.pendingRequestsMap[replicaToServe]) \
-            * replicaToServe.serviceTime
-        self.pendingRequestsMonitor.observe(
-            "%s %s" % (replicaToServe.id,
-                       self.pendingRequestsMap[replicaToServe]))
-        self.taskSentTimeTracker[task] = Simulation.now()
-
-    def sort(self, originalReplicaSet):
-
-        replicaSet = originalReplicaSet[0:]
-
-        if(self.REPLICA_SELECTION_STRATEGY == "random"):
-            # Pick a random node for the request.
-            # Represents SimpleSnitch + uniform request access.
-            # Ignore scores and everything else.
-            random.shuffle(replicaSet)
-
-        elif(self.REPLICA_SELECTION_STRATEGY == "pending"):
-            # Sort by number of pending requests
-            replicaSet.sort(key=self.pendingRequestsMap.get)
-        elif(self.REPLICA_SELECTION_STRATEGY == "response_time"):
-            # Sort by response times
-            replicaSet.sort(key=self.responseTimesMap.get)
-        elif(self.REPLICA_SELECTION_STRATEGY == "weighted_response_time"):
-            # Weighted random proportional to response times
-            m = {}
-            for each in replicaSet:
-                if ("serviceTime" not in self.expectedDelayMap[each]):
-                    m[each] = 0.0
-                else:
-                    m[each] = self.expectedDelayMap[each]["serviceTime"]
-            replicaSet.sort(key=m.get)
-            total = sum(map(lambda x: self.responseTimesMap[x], replicaSet))
-            selection = random.uniform(0, total)
-            cumSum = 0
-            nodeToSelect = None
-            i = 0
-            if (total != 0):
-                for entry in replicaSet:
-                    cumSum += self.responseTimesMap[entry]
-                    if (selection < cumSum):
-                        nodeToSelect = entry
-                        break
-                    i += 1
-                assert nodeToSelect is not None
-
-                replicaSet[0], replicaSet[i] = replicaSet[i], replicaSet[0]
-        elif(self.REPLICA_SELECTION_STRATEGY == "primary"):
-            pass
-        elif(self.REPLICA_SELECTION_STRATEGY == "pendingXserviceTime"):
-            # Sort by response times * client-local-pending-requests
-            replicaSet.sort(key=self.pendingXserviceMap.get)
-        elif(self.REPLICA_SELECTION_STRATEGY == "clairvoyant"):
-            # Sort by response times * pending-requests
-            oracleMap = {replica: (1 + len(replica.queueResource.activeQ
-                                   + replica.queueResource.waitQ))
-                         * replica.serviceTime
-                         for replica in originalReplicaSet}
-            replicaSet.sort(key=oracleMap.get)
-        elif(self.REPLICA_SELECTION_STRATEGY == "expDelay"):
-            sortMap = {}
-            for replica in originalReplicaSet:
-                sortMap[replica] = self.computeExpectedDelay(replica)
-            replicaSet.sort(key=sortMap.get)
-        elif(self.REPLICA_SELECTION_STRATEGY == "ds"):
-            firstNode = replicaSet[0]
-            firstNodeScore = self.dsScores[firstNode]
-            badnessThreshold = 0.0
-
-            if (firstNodeScore != 0.0):
-                for node in replicaSet[1:]:
-                    newNodeScore = self.dsScores[node]
-                    if ((firstNodeScore - newNodeScore)/firstNodeScore
-                       > badnessThreshold):
-                        replicaSet.sort(key=self.dsScores.get)
-        else:
-            print self.REPLICA_SELECTION_STRATEGY
-            assert False, "REPLICA_SELECTION_STRATEGY isn't set or is invalid"
-
-        return replicaSet
+        i = replicaToServe.id
+        self.pendingRequests[i] += 1
+        self.pendingXservice[i] = \
+            (1 + self.pendingRequests[i]) * replicaToServe.serviceTime
+        if (self.pendingRequestsMonitor.recording):
+            self.pendingRequestsMonitor.observe(i, self.pendingRequests[i])
+        self.feedbackVersions[i] += 1
+        self.taskSentTimeTracker[task] = kernel.now()
 
     def metricDecay(self, replica):
-        return math.exp(-(Simulation.now() - self.lastSeen[replica])
+        return math.exp(-(kernel.now() - self.lastSeen[replica.id])
                         / (2 * self.rateInterval))
 
-    def computeExpectedDelay(self, replica):
-        total = 0
-        if (len(self.expectedDelayMap[replica]) != 0):
-            metricMap = self.expectedDelayMap[replica]
-            twiceNetworkLatency = metricMap["nw"]
-            theta = (1 + self.pendingRequestsMap[replica]
-                     * constants.NUMBER_OF_CLIENTS
-                     + metricMap["queueSizeAfter"])
-            total += (twiceNetworkLatency +
-                      ((theta ** 3) * (metricMap["serviceTime"])))
-            self.edScoreMonitor.observe("%s %s %s %s %s" %
-                                        (replica.id,
-                                         metricMap["queueSizeAfter"],
-                                         metricMap["serviceTime"],
-                                         theta,
-                                         total))
-        else:
-            return 0
-        return total
-
     def maybeSendShadowReads(self, replicaToServe, replicaSet):
         if (random.uniform(0, 1.0) < self.shadowReadRatio):
             for replica in replicaSet:
                 if (replica is not replicaToServe):
                     shadowReadTask = task.Task("ShadowRead", None)
                     self.taskArrivalTimeTracker[shadowReadTask] =\
-                        Simulation.now()
-                    self.taskSentTimeTracker[shadowReadTask] = Simulation.now()
+                        kernel.now()
+                    self.taskSentTimeTracker[shadowReadTask] = kernel.now()
                     self.sendRequest(shadowReadTask, replica)
                     self.rateLimiters[replica].forceUpdates()
 
-    def updateEma(self, replica, metricMap):
-        alpha = 0.9
-        if (len(self.expectedDelayMap[replica]) == 0):
-            self.expectedDelayMap[replica] = metricMap
-            return
-
-        for metric in metricMap:
-            self.expectedDelayMap[replica][metric] \
-                = alpha * metricMap[metric] + (1 - alpha) \
-                * self.expectedDelayMap[replica][metric]
-
     def updateRates(self, replica, metricMap, task):
-        # Cubic Parameters go here
-        # beta = 0.2
-        # C = 0.000004
-        # Smax = 10
-        beta = self.cubicBeta
-        C = self.cubicC
-        Smax = self.cubicSmax
-        hysterisisFactor = self.hysterisisFactor
-        currentSendingRate = self.rateLimiters[replica].rate
-        currentReceiveRate = self.receiveRate[replica].getRate()
-
-        if (currentSendingRate < currentReceiveRate):
-            # This means that we need to bump up our own rate.
-            # For this, increase the rate according to a cubic
-            # window. Rmax is the sending-rate at which we last
-            # observed a congestion event. We grow aggressively
-            # towards this point, and then slow down, stabilise,
-            # and then advance further up. Every rate
-            # increase is capped by Smax.
-            T = Simulation.now() - self.lastRateDecrease[replica]
-            self.lastRateIncrease[replica] = Simulation.now()
-            Rmax = self.valueOfLastDecrease[replica]
-
-            newSendingRate = C * (T - (Rmax * beta/C)**(1.0/3.0))**3 + Rmax
-
-            if (newSendingRate - currentSendingRate > Smax):
-                self.rateLimiters[replica].rate += Smax
-            else:
-                self.rateLimiters[replica].rate = newSendingRate
-        elif (currentSendingRate > currentReceiveRate
-              and Simulation.now() - self.lastRateIncrease[replica]
-              > self.rateInterval * hysterisisFactor):
-            # The hysterisis factor in the condition is to ensure
-            # that the receive-rate measurements have enough time
-            # to adapt to the updated rate.
-
-            # So we're in here now, which means we need to back down.
-            # Multiplicatively decrease the rate by a factor of beta.
-            self.valueOfLastDecrease[replica] = currentSendingRate
-            self.rateLimiters[replica].rate *= beta
-            self.rateLimiters[replica].rate = \
-                max(self.rateLimiters[replica].rate, 0.0001)
-            self.lastRateDecrease[replica] = Simulation.now()
+        self.controller.onResponse(replica, metricMap)
 
         assert (self.rateLimiters[replica].rate > 0)
-        alphaObservation = (replica.id,
-                            self.rateLimiters[replica].rate)
-        receiveRateObs = (replica.id,
-                          self.receiveRate[replica].getRate())
-        self.rateMonitor.observe("%s %s" % alphaObservation)
-        self.receiveRateMonitor.observe("%s %s" % receiveRateObs)
-
-
-class DeliverMessageWithDelay(Simulation.Process):
-    def __init__(self):
-        Simulation.Process.__init__(self, name='DeliverMessageWithDelay')
-
-    def run(self, task, delay, replicaToServe):
-        yield Simulation.hold, self, delay
-        replicaToServe.enqueueTask(task)
-
-
-class ResponseHandler(Simulation.Process):
-    def __init__(self):
-        Simulation.Process.__init__(self, name='ResponseHandler')
-
-    def run(self, client, task, replicaThatServed):
-        yield Simulation.hold, self,
-        yield Simulation.waitevent, self, task.completionEvent
-
-        delay = constants.NW_LATENCY_BASE + \
-            random.normalvariate(constants.NW_LATENCY_MU,
-                                 constants.NW_LATENCY_SIGMA)
-        yield Simulation.hold, self, delay
+        if (self.rateMonitor.recording):
+            self.rateMonitor.observe(replica.id,
+                                     self.rateLimiters[replica].rate)
+        if (self.rateWindows.recording):
+            self.rateWindows.observe(replica.id,
+                                     self.rateLimiters[replica].rate)
+        if (self.receiveRateMonitor.recording):
+            self.receiveRateMonitor.observe(
+                replica.id, self.receiveRate[replica].getRate())
+
+    def onTaskComplete(self, task, metricMap):
+        # The response travels back over the network
+        kernel.schedule(self.networkDelay(), self.onResponse, task,
+                        metricMap)
+
+    def onResponse(self, task, metricMap):
+        replicaThatServed = task.replica
+        task.completionHandler = None
+        task.replica = None
 
         # OMG request completed. Time for some book-keeping
-        client.pendingRequestsMap[replicaThatServed] -= 1
-        client.pendingXserviceMap[replicaThatServed] = \
-            (1 + client.pendingRequestsMap[replicaThatServed]) \
-            * replicaThatServed.serviceTime
-
-        client.pendingRequestsMonitor.observe(
-            "%s %s" % (replicaThatServed.id,
-                       client.pendingRequestsMap[replicaThatServed]))
-
-        client.responseTimesMap[replicaThatServed] = \
-            Simulation.now() - client.taskSentTimeTracker[task]
-        client.latencyTrackerMonitor\
-              .observe("%s %s" % (replicaThatServed.id,
-                       Simulation.now() - client.taskSentTimeTracker[task]))
-        metricMap = task.completionEvent.signalparam
-        metricMap["responseTime"] = client.responseTimesMap[replicaThatServed]
-        metricMap["nw"] = metricMap["responseTime"] - metricMap["serviceTime"]
-        client.updateEma(replicaThatServed, metricMap)
-        client.receiveRate[replicaThatServed].add(1)
+        i = replicaThatServed.id
+        self.pendingRequests[i] -= 1
+        self.pendingXservice[i] = \
+            (1 + self.pendingRequests[i]) * replicaThatServed.serviceTime
+
+        if (self.pendingRequestsMonitor.recording):
+            self.pendingRequestsMonitor.observe(i, self.pendingRequests[i])
+
+        now = kernel.now()
+        responseTime = now - self.taskSentTimeTracker[task]
+        self.responseTimes[i] = responseTime
+        if (self.latencyTrackerMonitor.recording):
+            self.latencyTrackerMonitor.observe(i, responseTime)
+        metricMap["responseTime"] = responseTime
+        metricMap["nw"] = responseTime - metricMap["serviceTime"]
+        self.receiveRate[replicaThatServed].add(1)
 
         # Backpressure related book-keeping
-        if (client.backpressure):
-            client.updateRates(replicaThatServed, metricMap, task)
+        if (self.backpressure):
+            self.updateRates(replicaThatServed, metricMap, task)
 
-        client.lastSeen[replicaThatServed] = Simulation.now()
+        self.lastSeen[i] = now
+        self.strategy.onResponse(replicaThatServed, metricMap)
+        self.feedbackVersions[i] += 1
 
-        if (client.REPLICA_SELECTION_STRATEGY == "ds"):
-            client.latencyEdma[replicaThatServed]\
-                  .update(metricMap["responseTime"])
-
-        del client.taskSentTimeTracker[task]
-        del client.taskArrivalTimeTracker[task]
+        del self.taskSentTimeTracker[task]
+        del self.taskArrivalTimeTracker[task]
 
         # Does not make sense to record shadow read latencies
         # as a latency measurement
         if (task.latencyMonitor is not None):
-            task.latencyMonitor.observe("%s %s" %
-                                        (Simulation.now() - task.start,
-                                         client.id))
+            latency = now - task.start
+            task.latencyMonitor.observe(latency, self.id)
+            self.latencyWindows.observe(latency)
+            if (now > self.summaryWarmup):
+                self.latencySketch.add(latency)
+                self.classSketches[task.priority].add(latency)
 
 
-class BackpressureScheduler(Simulation.Process):
+class Backlog(object):
+    """Tasks waiting to be sent, as (task, replicaSet), in one FIFO queue
+       per priority class. Lower classes go first."""
+    def __init__(self):
+        self.queues = {}
+        self.classes = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, entry, priority=task.LATENCY_CRITICAL):
+        if (priority not in self.queues):
+            self.queues[priority] = collections.deque()
+            bisect.insort(self.classes, priority)
+        self.queues[priority].append(entry)
+        self.length += 1
+
+    def queue(self):
+        # The queue of the first class with tasks waiting
+        return self.queues[self.headPriority()]
+
+    def headPriority(self):
+        # The first class with tasks waiting
+        for priority in self.classes:
+            if (len(self.queues[priority]) != 0):
+                return priority
+
+    def head(self):
+        return self.queue()[0]
+
+    def popleft(self):
+        self.length -= 1
+        return self.queue().popleft()
+
+
+class BackpressureScheduler(object):
+    """Drains a client's backlog, driven by timer callbacks: it runs
+       when a task is enqueued, and while in backpressure, once, when
+       the earliest of the head task's rate limiters has a token. That
+       wakeup is moved when one of their rates changes, and dropped
+       when a task of a class that goes first is enqueued."""
     def __init__(self, id_, client):
         self.id = id_
-        self.backlogQueue = []
+        self.backlogQueue = Backlog()
         self.client = client
         self.count = 0
-        self.backlogReadyEvent = Simulation.SimEvent("BacklogReady")
-        Simulation.Process.__init__(self, name='BackpressureScheduler')
+        self.scheduled = False
+        # Rate limiters the head task waits on, and when the earliest
+        # of them has a token
+        self.waitingOn = []
+        self.wakeupTime = None
+        # Wakeups are cancelled by moving on to a new generation, the
+        # stale one then fires to no effect
+        self.generation = 0
+        # The last replica set ordered, the feedback versions of its
+        # replicas then, and the order
+        self.sortedFor = None
+        self.sortedVersions = None
+        self.sortedReplicaSet = None
 
     def run(self):
-        while(1):
-            yield Simulation.hold, self,
-
-            if (len(self.backlogQueue) != 0):
-                task, replicaSet = self.backlogQueue[0]
-                sortedReplicaSet = self.client.sort(replicaSet)
-                sent = False
-                minDurationToWait = 1e10   # arbitrary large value
-                minReplica = None
-                for replica in sortedReplicaSet:
-                    currentTokens = self.client.rateLimiters[replica].tokens
-                    self.client.tokenMonitor.observe("%s %s"
-                                                     % (replica.id,
-                                                        currentTokens))
-                    durationToWait = \
-                        self.client.rateLimiters[replica].tryAcquire()
-                    if (durationToWait == 0):
-                        assert self.client.rateLimiters[replica].tokens >= 1
-                        self.backlogQueue.pop(0)
-                        self.client.sendRequest(task, replica)
-                        self.client.maybeSendShadowReads(replica, replicaSet)
-                        sent = True
-                        self.client.rateLimiters[replica].update()
-                        break
-                    else:
-                        if durationToWait < minDurationToWait:
-                            minDurationToWait = durationToWait
-                            minReplica = replica
-                        assert self.client.rateLimiters[replica].tokens < 1
-
-                if (not sent):
-                    # Backpressure mode. Wait for the least amount of time
-                    # necessary until at least one rate limiter is expected
-                    # to be available
-                    yield Simulation.hold, self, minDurationToWait
-                    # NOTE: In principle, these 2 lines below would not be
-                    # necessary because the rate limiter would have exactly 1
-                    # token after minDurationWait. However, due to
-                    # floating-point arithmetic precision we might not have 1
-                    # token and this would cause the simulation to enter an
-                    # almost infinite loop. These 2 lines by-pass this problem.
-                    self.client.rateLimiters[minReplica].tokens = 1
-                    self.client.rateLimiters[minReplica].lastSent = Simulation.now()
-                    minReplica = None
+        self.scheduled = False
+        while (len(self.backlogQueue) != 0):
+            task, replicaSet = self.backlogQueue.head()
+            sortedReplicaSet = self.select(replicaSet)
+            for replica in sortedReplicaSet:
+                rateLimiter = self.client.rateLimiters[replica]
+                if (self.client.tokenMonitor.recording):
+                    self.client.tokenMonitor.observe(replica.id,
+                                                     rateLimiter.tokens)
+                if (rateLimiter.tryAcquire() == 0):
+                    self.backlogQueue.popleft()
+                    self.client.sendRequest(task, replica)
+                    self.client.maybeSendShadowReads(replica, replicaSet)
+                    rateLimiter.update()
+                    break
             else:
-                yield Simulation.waitevent, self, self.backlogReadyEvent
-                self.backlogReadyEvent = Simulation.SimEvent("BacklogReady")
+                # Backpressure mode. Wait until the first of the
+                # replicas' rate limiters has a token
+                self.scheduled = True
+                self.wait([self.client.rateLimiters[replica]
+                           for replica in sortedReplicaSet])
+                return
+
+    def select(self, replicaSet):
+        """The strategy's order of replicaSet, reused for as long as
+           the client's feedback about its replicas is unchanged, if the
+           strategy orders by nothing else"""
+        strategy = self.client.strategy
+        if (not strategy.cacheable):
+            return strategy.select(replicaSet)
+        feedbackVersions = self.client.feedbackVersions
+        versions = [feedbackVersions[replica.id] for replica in replicaSet]
+        if (replicaSet is not self.sortedFor
+                or versions != self.sortedVersions):
+            self.sortedFor = replicaSet
+            self.sortedVersions = versions
+            self.sortedReplicaSet = strategy.select(replicaSet)
+        return self.sortedReplicaSet
+
+    def wait(self, rateLimiters):
+        self.waitingOn = rateLimiters
+        for rateLimiter in rateLimiters:
+            rateLimiter.waiters.append(self)
+        self.reschedule()
+
+    def reschedule(self):
+        """(Re)schedules the wakeup for the earliest next token"""
+        wakeupTime = min(rateLimiter.nextTokenTime()
+                         for rateLimiter in self.waitingOn)
+        if (wakeupTime == self.wakeupTime):
+            return
+        self.wakeupTime = wakeupTime
+        self.generation += 1
+        kernel.schedule(max(0.0, wakeupTime - kernel.now()), self.wake,
+                        self.generation)
+
+    def stopWaiting(self):
+        for rateLimiter in self.waitingOn:
+            rateLimiter.waiters.remove(self)
+        self.waitingOn = []
+        self.wakeupTime = None
+
+    def wake(self, generation):
+        if (generation != self.generation):
+            return
+        self.stopWaiting()
+        self.run()
 
     def enqueue(self, task, replicaSet):
-        self.backlogQueue.append((task, replicaSet))
-        self.backlogReadyEvent.signal()
+        # A task that goes before the head task need not wait for the
+        # head task's rate limiters: its replicas may have tokens
+        if (len(self.waitingOn) != 0
+                and task.priority < self.backlogQueue.headPriority()):
+            self.stopWaiting()
+            self.generation += 1
+            self.scheduled = False
+        self.backlogQueue.append((task, replicaSet), task.priority)
+        if (not self.scheduled):
+            self.scheduled = True
+            kernel.schedule(0, self.run)
 
 
 class RateLimiter():
+    """A token bucket that fills at rate tokens per rateInterval, up to
+       maxTokens. Tokens accrue lazily, from tokens at lastSent, and a
+       token is available from nextTokenTime() on. Availability is
+       decided on time, and a bucket short of a token counts what it
+       accrued from nextTokenTime() on top of that token, so a wakeup
+       scheduled for that time finds at least one there."""
     def __init__(self, id_, client, maxTokens, rateInterval):
         self.id = id_
         self.rate = 5
@@ -459,23 +414,39 @@ class RateLimiter():
         self.tokens = 0
         self.rateInterval = rateInterval
         self.maxTokens = maxTokens
+        # BackpressureSchedulers waiting for a token from this limiter
+        self.waiters = []
+
+    def setRate(self, rate):
+        self.rate = rate
+        for scheduler in self.waiters:
+            scheduler.reschedule()
 
     # These updates can be forced due to shadowReads
     def update(self):
-        self.lastSent = Simulation.now()
+        self.lastSent = kernel.now()
         self.tokens -= 1
 
+    def nextTokenTime(self):
+        if (self.tokens >= 1):
+            return self.lastSent
+        return self.lastSent \
+            + (1 - self.tokens) * self.rateInterval / float(self.rate)
+
     def tryAcquire(self):
-        tokens = min(self.maxTokens, self.tokens
-                     + self.rate/float(self.rateInterval)
-                     * (Simulation.now() - self.lastSent))
-        if (tokens >= 1):
-            self.tokens = tokens
-            return 0
-        else:
+        now = kernel.now()
+        nextTokenTime = self.nextTokenTime()
+        if (now < nextTokenTime):
             assert self.tokens < 1
-            timetowait = (1 - tokens) * self.rateInterval/self.rate
-            return timetowait
+            return nextTokenTime - now
+        # Accrued since the bucket first held a token (lastSent, if it
+        # already did then), on top of what it held at that time
+        accrued = self.rate/float(self.rateInterval) * (now - nextTokenTime)
+        if (self.tokens >= 1):
+            self.tokens = min(self.maxTokens, self.tokens + accrued)
+        else:
+            self.tokens = min(self.maxTokens, 1 + accrued)
+        return 0
 
     def forceUpdates(self):
         self.tokens -= 1
@@ -483,7 +454,7 @@ class RateLimiter():
     def getTokens(self):
         return min(self.maxTokens, self.tokens
                    + self.rate/float(self.rateInterval)
-                   * (Simulation.now() - self.lastSent))
+                   * (kernel.now() - self.lastSent))
 
 
 class ReceiveRate():
@@ -499,7 +470,7 @@ class ReceiveRate():
         return self.rate
 
     def add(self, requests):
-        now = int(Simulation.now()/self.interval)
+        now = int(kernel.now()/self.interval)
         if (now - self.last < self.interval):
             self.count += requests
             if (now > self.last):
@@ -512,52 +483,3 @@ class ReceiveRate():
             self.rate = self.count
             self.last = now
             self.count = 0
-
-
-class DynamicSnitch(Simulation.Process):
-    '''
-    Model for Cassandra's native dynamic snitching approach
-    '''
-    def __init__(self, client, snitchUpdateInterval):
-        self.SNITCHING_INTERVAL = snitchUpdateInterval
-        self.client = client
-        Simulation.Process.__init__(self, name='DynamicSnitch')
-
-    def run(self):
-        # Start each process with a minor delay
-
-        while(1):
-            yield Simulation.hold, self, self.SNITCHING_INTERVAL
-
-            # Adaptation of DynamicEndpointSnitch algorithm
-            maxLatency = 1.0
-            maxPenalty = 1.0
-            latencies = [entry.get_snapshot().get_median()
-                         for entry in self.client.latencyEdma.values()]
-            latenciesGtOne = [latency for latency in latencies if latency > 1.0]
-            if (len(latencies) == 0):  # nothing to see here
-                continue
-            maxLatency = max(latenciesGtOne) if len(latenciesGtOne) > 0 else 1.0
-            penalties = {}
-            for peer in self.client.serverList:
-                penalties[peer] = self.client.lastSeen[peer]
-                penalties[peer] = Simulation.now() - penalties[peer]
-                if (penalties[peer] > self.SNITCHING_INTERVAL):
-                    penalties[peer] = self.SNITCHING_INTERVAL
-
-            penaltiesGtOne = [penalty for penalty in penalties.values()
-                              if penalty > 1.0]
-            maxPenalty = max(penalties.values()) \
-                if len(penaltiesGtOne) > 0 else 1.0
-
-            for peer in self.client.latencyEdma:
-                score = self.client.latencyEdma[peer] \
-                            .get_snapshot() \
-                            .get_median() / float(maxLatency)
-
-                if (peer in penalties):
-                    score += penalties[peer] / float(maxPenalty)
-                else:
-                    score += 1
-                assert score >= 0 and score <= 2.0
-                self.client.dsScores[peer] = score
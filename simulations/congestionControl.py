@@ -0,0 +1,213 @@
+"""
+    Client-side congestion control: how a client sets the rate of its
+    rate limiter for each replica, from the responses it gets back
+    while backpressure is on. A client picks its controller once, at
+    construction, and calls onResponse() for every response. The
+    controllers read their parameters off the client.
+
+    Rates are in tokens per rateInterval. Per-replica state is kept in
+    array columns indexed by server id, as on the client.
+"""
+import array
+import collections
+import math
+import kernel
+
+# No controller cuts a rate below this
+MIN_RATE = 0.0001
+
+# Weight of the newest response time in VegasController's smoothed
+# one, as for TCP's smoothed RTT
+RTT_GAIN = 0.125
+
+# BbrController: the bandwidth estimate is the largest receive rate of
+# the last BBR_WINDOW rateIntervals. Rates start at STARTUP_GAIN times
+# it, until it stops growing by FULL_BW_GROWTH over FULL_BW_ROUNDS
+# intervals, then cycle through PROBE_GAINS, one per interval.
+BBR_WINDOW = 10
+STARTUP_GAIN = 2 / math.log(2)
+FULL_BW_GROWTH = 1.25
+FULL_BW_ROUNDS = 3
+PROBE_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)
+
+
+class RateController(object):
+    """Leaves every rate where it is"""
+    def __init__(self, client):
+        self.client = client
+        self.numSlots = len(client.pendingRequests)
+
+    def onResponse(self, replica, metricMap):
+        pass
+
+
+class CubicController(RateController):
+    """Grows the rate along a cubic towards, and then past, the rate of
+       the last decrease, and cuts it by a factor of cubicBeta when the
+       replica returns fewer responses than it is sent"""
+    def __init__(self, client):
+        RateController.__init__(self, client)
+        self.lastRateDecrease = array.array("d", [0.0]) * self.numSlots
+        self.valueOfLastDecrease = array.array("d", [10.0]) * self.numSlots
+        self.lastRateIncrease = array.array("d", [0.0]) * self.numSlots
+
+    def onResponse(self, replica, metricMap):
+        client = self.client
+        # Cubic Parameters go here
+        # beta = 0.2
+        # C = 0.000004
+        # Smax = 10
+        beta = client.cubicBeta
+        C = client.cubicC
+        Smax = client.cubicSmax
+        hysterisisFactor = client.hysterisisFactor
+        rateLimiter = client.rateLimiters[replica]
+        currentSendingRate = rateLimiter.rate
+        currentReceiveRate = client.receiveRate[replica].getRate()
+        i = replica.id
+
+        if (currentSendingRate < currentReceiveRate):
+            # This means that we need to bump up our own rate.
+            # For this, increase the rate according to a cubic
+            # window. Rmax is the sending-rate at which we last
+            # observed a congestion event. We grow aggressively
+            # towards this point, and then slow down, stabilise,
+            # and then advance further up. Every rate
+            # increase is capped by Smax.
+            T = kernel.now() - float(self.lastRateDecrease[i])
+            self.lastRateIncrease[i] = kernel.now()
+            Rmax = float(self.valueOfLastDecrease[i])
+
+            newSendingRate = C * (T - (Rmax * beta/C)**(1.0/3.0))**3 + Rmax
+
+            if (newSendingRate - currentSendingRate > Smax):
+                rateLimiter.setRate(currentSendingRate + Smax)
+            else:
+                rateLimiter.setRate(newSendingRate)
+        elif (currentSendingRate > currentReceiveRate
+              and kernel.now() - self.lastRateIncrease[i]
+              > client.rateInterval * hysterisisFactor):
+            # The hysterisis factor in the condition is to ensure
+            # that the receive-rate measurements have enough time
+            # to adapt to the updated rate.
+
+            # So we're in here now, which means we need to back down.
+            # Multiplicatively decrease the rate by a factor of beta.
+            self.valueOfLastDecrease[i] = currentSendingRate
+            rateLimiter.setRate(max(currentSendingRate * beta, MIN_RATE))
+            self.lastRateDecrease[i] = kernel.now()
+
+
+class AimdController(RateController):
+    """Adds additiveIncrease to the rate once per rateInterval while the
+       replica keeps up with it, and cuts it by a factor of cubicBeta,
+       at most once per rateInterval * hysterisisFactor, when it does
+       not"""
+    def __init__(self, client):
+        RateController.__init__(self, client)
+        self.lastRateChange = array.array("d", [0.0]) * self.numSlots
+
+    def onResponse(self, replica, metricMap):
+        client = self.client
+        rateLimiter = client.rateLimiters[replica]
+        currentSendingRate = rateLimiter.rate
+        currentReceiveRate = client.receiveRate[replica].getRate()
+        sinceChange = kernel.now() - self.lastRateChange[replica.id]
+
+        if (currentSendingRate < currentReceiveRate
+                and sinceChange >= client.rateInterval):
+            rateLimiter.setRate(currentSendingRate + client.additiveIncrease)
+        elif (currentSendingRate > currentReceiveRate
+              and sinceChange > client.rateInterval
+              * client.hysterisisFactor):
+            rateLimiter.setRate(max(currentSendingRate * client.cubicBeta,
+                                    MIN_RATE))
+        else:
+            return
+        self.lastRateChange[replica.id] = kernel.now()
+
+
+class VegasController(RateController):
+    """Delay-based, after TCP Vegas. By Little's law, the client has
+       about rate * (RTT - baseRTT) / rateInterval requests queued at a
+       replica, RTT being its smoothed response time and baseRTT the
+       least one seen. Once per rateInterval, the rate goes up by
+       additiveIncrease while fewer than vegasAlpha are queued, and
+       down by as much while more than vegasBeta are."""
+    def __init__(self, client):
+        RateController.__init__(self, client)
+        self.baseRtt = array.array("d", [float("inf")]) * self.numSlots
+        self.rtt = array.array("d", [0.0]) * self.numSlots
+        self.lastRateChange = array.array("d", [0.0]) * self.numSlots
+
+    def onResponse(self, replica, metricMap):
+        client = self.client
+        i = replica.id
+        responseTime = metricMap["responseTime"]
+        if (responseTime < self.baseRtt[i]):
+            self.baseRtt[i] = responseTime
+        if (self.rtt[i] == 0):
+            self.rtt[i] = responseTime
+        else:
+            self.rtt[i] += RTT_GAIN * (responseTime - self.rtt[i])
+
+        now = kernel.now()
+        if (now - self.lastRateChange[i] < client.rateInterval):
+            return
+        rateLimiter = client.rateLimiters[replica]
+        queued = rateLimiter.rate * (self.rtt[i] - self.baseRtt[i]) \
+            / client.rateInterval
+        if (queued < client.vegasAlpha):
+            rateLimiter.setRate(rateLimiter.rate + client.additiveIncrease)
+        elif (queued > client.vegasBeta):
+            rateLimiter.setRate(max(rateLimiter.rate
+                                    - client.additiveIncrease, MIN_RATE))
+        else:
+            return
+        self.lastRateChange[i] = now
+
+
+class BbrController(RateController):
+    """After BBR: sends at a gain times the replica's bottleneck
+       bandwidth, estimated as the largest rate it returned responses
+       at over the last BBR_WINDOW rateIntervals. A startup gain finds
+       that bandwidth, then gains above and below 1 probe for more of
+       it and drain the queue the probe built."""
+    def __init__(self, client):
+        RateController.__init__(self, client)
+        self.receiveRates = [collections.deque(maxlen=BBR_WINDOW)
+                             for i in range(self.numSlots)]
+        self.lastInterval = array.array("l", [-1]) * self.numSlots
+        self.startup = array.array("b", [True]) * self.numSlots
+        self.fullBw = array.array("d", [0.0]) * self.numSlots
+        self.fullBwRounds = array.array("l", [0]) * self.numSlots
+
+    def onResponse(self, replica, metricMap):
+        client = self.client
+        i = replica.id
+        interval = int(kernel.now() / client.rateInterval)
+        if (interval == self.lastInterval[i]):
+            return
+        self.lastInterval[i] = interval
+
+        receiveRates = self.receiveRates[i]
+        receiveRates.append(client.receiveRate[replica].getRate())
+        bottleneckBw = max(receiveRates)
+        if (self.startup[i]):
+            gain = STARTUP_GAIN
+            if (bottleneckBw >= self.fullBw[i] * FULL_BW_GROWTH):
+                self.fullBw[i] = bottleneckBw
+                self.fullBwRounds[i] = 0
+            else:
+                self.fullBwRounds[i] += 1
+                self.startup[i] = self.fullBwRounds[i] < FULL_BW_ROUNDS
+        else:
+            gain = PROBE_GAINS[interval % len(PROBE_GAINS)]
+        client.rateLimiters[replica].setRate(max(gain * bottleneckBw,
+                                                 MIN_RATE))
+
+
+CONTROLLERS = {"cubic": CubicController,
+               "aimd": AimdController,
+               "vegas": VegasController,
+               "bbr": BbrController}
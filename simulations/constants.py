@@ -3,3 +3,9 @@ NW_LATENCY_BASE = 0.960
 NW_LATENCY_MU = 0.040
 NW_LATENCY_SIGMA = 0.0
 NUMBER_OF_CLIENTS = 1
+SUMMARY_WARMUP = 2000.0
+SUMMARY_WARMUP_FRACTION = 0.1
+RATE_CONTROLLER = "cubic"
+ADDITIVE_INCREASE = 1.0
+VEGAS_ALPHA = 2.0
+VEGAS_BETA = 4.0
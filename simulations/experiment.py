@@ -4,15 +4,17 @@ import client
 import workload
 import argparse
 import random
-import constants
 import numpy
-import sys
 import muUpdater
-
-
-def printMonitorTimeSeriesToFile(fileDesc, prefix, monitor):
-    for entry in monitor:
-        fileDesc.write("%s %s %s\n" % (prefix, entry[0], entry[1]))
+import kernel
+import sampler
+import replicaSelection
+import congestionControl
+import placement
+import keyspace
+import monitors
+import sketch
+import constants
 
 
 # class WorkloadUpdater(Simulation.Process):
@@ -31,8 +33,7 @@ def printMonitorTimeSeriesToFile(fileDesc, prefix, monitor):
 #             # old = self.workload.model_param
 #             # self.workload.model_param = self.value
 #             # self.workload.clientList = self.clients
-#             # self.workload.total = \
-#             #     sum(client.demandWeight for client in self.clients)
+#             # self.workload.updateDemandWeights()
 #             # yield Simulation.hold, self, 1000
 #             # self.workload.model_param = old
 #             self.servers[0].serviceTime = 1000
@@ -47,22 +48,46 @@ class ClientAdder(Simulation.Process):
 
 
 def runExperiment(args):
+    """Runs one experiment, as configured by args (see config()), and
+       returns its latency summary"""
 
     # Set the random seed
     random.seed(args.seed)
     numpy.random.seed(args.seed)
-
-    Simulation.initialize()
+    sampler.initialize(args.seed)
+
+    # Latencies before the warmup are left out of the summary, which
+    # would be empty if the warmup outlasted the run
+    summaryWarmup = args.summaryWarmup
+    if (summaryWarmup is None):
+        summaryWarmup = min(constants.SUMMARY_WARMUP,
+                            constants.SUMMARY_WARMUP_FRACTION
+                            * args.simulationDuration)
+    elif (summaryWarmup >= args.simulationDuration):
+        raise ValueError("summaryWarmup (%s) must be shorter than "
+                         "simulationDuration (%s)"
+                         % (summaryWarmup, args.simulationDuration))
+
+    # Each generator replays every numWorkload-th record of the trace
+    trace = None
+    if (args.workloadModel == "trace"):
+        trace = workload.openTrace(args.traceFile)
+        if (len(trace) < args.numRequests):
+            raise ValueError("numRequests (%d) is more than the %d records"
+                             " of %s" % (args.numRequests, len(trace),
+                                         args.traceFile))
+
+    kernel.initialize(args.kernel)
+    monitors.initialize(args.monitorSink, args.logFolder, args.expPrefix,
+                        fileFormat=args.monitorFormat,
+                        windowSize=args.windowSize,
+                        level=args.instrumentation,
+                        sampleEvery=args.sampleEvery)
 
     servers = []
     clients = []
     workloadGens = []
 
-    constants.NW_LATENCY_BASE = args.nwLatencyBase
-    constants.NW_LATENCY_MU = args.nwLatencyMu
-    constants.NW_LATENCY_SIGMA = args.nwLatencySigma
-    constants.NUMBER_OF_CLIENTS = args.numClients
-
     assert args.expScenario != ""
 
     serviceRatePerServer = []
@@ -138,11 +163,11 @@ def runExperiment(args):
             mup = muUpdater.MuUpdater(serv, args.intervalParam,
                                       args.serviceTime,
                                       args.timeVaryingDrift)
-            Simulation.activate(mup, mup.run(), at=0.0)
+            kernel.schedule(0.0, mup.run)
             servers.append(serv)
     else:
-        print "Unknown experiment scenario"
-        sys.exit(-1)
+        raise ValueError("Unknown experiment scenario: %s"
+                         % args.expScenario)
 
     baseDemandWeight = 1.0
     clientWeights = []
@@ -168,6 +193,19 @@ def runExperiment(args):
     assert sum(clientWeights) > 0.99 * args.numClients
     assert sum(clientWeights) <= args.numClients
 
+    # Replica placement, shared by all clients
+    replicaPlacement = placement.build(args.placement, servers,
+                                       args.replicationFactor,
+                                       args.numVnodes)
+    keySpace = None
+    if (args.accessPattern != "uniform"):
+        keySpace = keyspace.KeySpace("keys", replicaPlacement,
+                                     args.accessPattern,
+                                     args.numKeys,
+                                     args.zipfExponent,
+                                     args.hotspotFraction,
+                                     args.hotspotOpFraction)
+
     # Start the clients
     for i in range(args.numClients):
         c = client.Client(id_="Client%s" % (i),
@@ -182,11 +220,22 @@ def runExperiment(args):
                           cubicSmax=args.cubicSmax,
                           cubicBeta=args.cubicBeta,
                           hysterisisFactor=args.hysterisisFactor,
-                          demandWeight=clientWeights[i])
+                          demandWeight=clientWeights[i],
+                          placement=replicaPlacement,
+                          keySpace=keySpace,
+                          nwLatencyBase=args.nwLatencyBase,
+                          nwLatencyMu=args.nwLatencyMu,
+                          nwLatencySigma=args.nwLatencySigma,
+                          numClients=args.numClients,
+                          summaryWarmup=summaryWarmup,
+                          rateController=args.rateController,
+                          additiveIncrease=args.additiveIncrease,
+                          vegasAlpha=args.vegasAlpha,
+                          vegasBeta=args.vegasBeta)
         clients.append(c)
 
     # Start workload generators (analogous to YCSB)
-    latencyMonitor = Simulation.Monitor(name="Latency")
+    latencyMonitor = monitors.Monitor("Latency", "0")
 
     # This is where we set the inter-arrival times based on
     # the required utilization level and the service time
@@ -208,84 +257,54 @@ def runExperiment(args):
                               clients,
                               args.workloadModel,
                               interArrivalTime * args.numWorkload,
-                              args.numRequests/args.numWorkload)
-        Simulation.activate(w, w.run(),
-                            at=0.0),
+                              args.numRequests/args.numWorkload,
+                              trace=trace[i::args.numWorkload]
+                              if trace is not None else None,
+                              placement=replicaPlacement,
+                              traceKeys=not args.tracePartitions,
+                              batchFraction=args.batchFraction)
+        kernel.schedule(0.0, w.run)
         workloadGens.append(w)
 
     # Begin simulation
-    Simulation.simulate(until=args.simulationDuration)
-
-    #
-    # Print a bunch of timeseries
-    #
-    pendingRequestsFD = open("../%s/%s_PendingRequests" %
-                             (args.logFolder,
-                              args.expPrefix), 'w')
-    waitMonFD = open("../%s/%s_WaitMon" % (args.logFolder,
-                                           args.expPrefix), 'w')
-    actMonFD = open("../%s/%s_ActMon" % (args.logFolder,
-                                         args.expPrefix), 'w')
-    latencyFD = open("../%s/%s_Latency" % (args.logFolder,
-                                           args.expPrefix), 'w')
-    latencyTrackerFD = open("../%s/%s_LatencyTracker" %
-                            (args.logFolder, args.expPrefix), 'w')
-    rateFD = open("../%s/%s_Rate" % (args.logFolder,
-                                     args.expPrefix), 'w')
-    tokenFD = open("../%s/%s_Tokens" % (args.logFolder,
-                                        args.expPrefix), 'w')
-    receiveRateFD = open("../%s/%s_ReceiveRate" % (args.logFolder,
-                                                   args.expPrefix), 'w')
-    edScoreFD = open("../%s/%s_EdScore" % (args.logFolder,
-                                           args.expPrefix), 'w')
-    serverRRFD = open("../%s/%s_serverRR" % (args.logFolder,
-                                             args.expPrefix), 'w')
-
-    for clientNode in clients:
-        printMonitorTimeSeriesToFile(pendingRequestsFD,
-                                     clientNode.id,
-                                     clientNode.pendingRequestsMonitor)
-        printMonitorTimeSeriesToFile(latencyTrackerFD,
-                                     clientNode.id,
-                                     clientNode.latencyTrackerMonitor)
-        printMonitorTimeSeriesToFile(rateFD,
-                                     clientNode.id,
-                                     clientNode.rateMonitor)
-        printMonitorTimeSeriesToFile(tokenFD,
-                                     clientNode.id,
-                                     clientNode.tokenMonitor)
-        printMonitorTimeSeriesToFile(receiveRateFD,
-                                     clientNode.id,
-                                     clientNode.receiveRateMonitor)
-        printMonitorTimeSeriesToFile(edScoreFD,
-                                     clientNode.id,
-                                     clientNode.edScoreMonitor)
+    kernel.simulate(until=args.simulationDuration)
+
+    # Write out the timeseries still held in memory
+    monitors.close()
+
     for serv in servers:
-        printMonitorTimeSeriesToFile(waitMonFD,
-                                     serv.id,
-                                     serv.queueResource.waitMon)
-        printMonitorTimeSeriesToFile(actMonFD,
-                                     serv.id,
-                                     serv.queueResource.actMon)
-        printMonitorTimeSeriesToFile(serverRRFD,
-                                     serv.id,
-                                     serv.serverRRMonitor)
+        if (not serv.waitMon.recording):
+            break
         print "------- Server:%s %s ------" % (serv.id, "WaitMon")
-        print "Mean:", serv.queueResource.waitMon.mean()
+        print "Mean:", serv.waitMon.mean()
 
         print "------- Server:%s %s ------" % (serv.id, "ActMon")
-        print "Mean:", serv.queueResource.actMon.mean()
+        print "Mean:", serv.actMon.mean()
 
     print "------- Latency ------"
-    print "Mean Latency:",\
-      sum([float(entry[1].split()[0]) for entry in latencyMonitor])/float(len(latencyMonitor))
+    print "Mean Latency:", latencyMonitor.mean()
+
+    summary = sketch.latencySummary(dict((c.id, c.latencySketch)
+                                         for c in clients))
+    # With batch reads, also the quantiles of each priority class
+    classes = set(priority for c in clients for priority in c.classSketches)
+    if (len(classes) > 1):
+        summary["classes"] = dict(
+            (str(priority),
+             sketch.latencySummary(dict((c.id, c.classSketches[priority])
+                                        for c in clients))["all"])
+            for priority in classes)
+    sketch.writeSummary(monitors.filePath("LatencySummary.json"), summary)
+    if (summary["all"]["count"] > 0):
+        for q in sketch.QUANTILES:
+            key = "p%g" % (q * 100)
+            print "%s Latency:" % key, summary["all"][key]
 
-    printMonitorTimeSeriesToFile(latencyFD, "0",
-                                 latencyMonitor)
     assert args.numRequests == len(latencyMonitor)
+    return summary
 
 
-if __name__ == '__main__':
+def argumentParser():
     parser = argparse.ArgumentParser(description='Absinthe sim.')
     parser.add_argument('--numClients', nargs='?',
                         type=int, default=1)
@@ -299,6 +318,12 @@ if __name__ == '__main__':
                         type=float, default=1)
     parser.add_argument('--workloadModel', nargs='?',
                         type=str, default="constant")
+    parser.add_argument('--traceFile', nargs='?',
+                        type=str, default="")
+    parser.add_argument('--tracePartitions', action='store_true',
+                        default=False)
+    parser.add_argument('--batchFraction', nargs='?',
+                        type=float, default=0.0)
     parser.add_argument('--utilization', nargs='?',
                         type=float, default=0.90)
     parser.add_argument('--serviceTimeModel', nargs='?',
@@ -306,7 +331,8 @@ if __name__ == '__main__':
     parser.add_argument('--replicationFactor', nargs='?',
                         type=int, default=1)
     parser.add_argument('--selectionStrategy', nargs='?',
-                        type=str, default="pending")
+                        choices=sorted(replicaSelection.STRATEGIES),
+                        default="pending")
     parser.add_argument('--shadowReadRatio', nargs='?',
                         type=float, default=0.10)
     parser.add_argument('--rateInterval', nargs='?',
@@ -319,10 +345,31 @@ if __name__ == '__main__':
                         type=float, default=0.2)
     parser.add_argument('--hysterisisFactor', nargs='?',
                         type=float, default=2)
+    parser.add_argument('--rateController', nargs='?',
+                        choices=sorted(congestionControl.CONTROLLERS),
+                        default="cubic")
+    parser.add_argument('--additiveIncrease', nargs='?',
+                        type=float, default=1.0)
+    parser.add_argument('--vegasAlpha', nargs='?',
+                        type=float, default=2.0)
+    parser.add_argument('--vegasBeta', nargs='?',
+                        type=float, default=4.0)
     parser.add_argument('--backpressure', action='store_true',
                         default=False)
     parser.add_argument('--accessPattern', nargs='?',
-                        type=str, default="uniform")
+                        choices=keyspace.DISTRIBUTIONS, default="uniform")
+    parser.add_argument('--numKeys', nargs='?',
+                        type=int, default=100000)
+    parser.add_argument('--zipfExponent', nargs='?',
+                        type=float, default=0.99)
+    parser.add_argument('--hotspotFraction', nargs='?',
+                        type=float, default=0.2)
+    parser.add_argument('--hotspotOpFraction', nargs='?',
+                        type=float, default=0.8)
+    parser.add_argument('--placement', nargs='?',
+                        choices=placement.PLACEMENTS, default="ring")
+    parser.add_argument('--numVnodes', nargs='?',
+                        type=int, default=256)
     parser.add_argument('--nwLatencyBase', nargs='?',
                         type=float, default=0.960)
     parser.add_argument('--nwLatencyMu', nargs='?',
@@ -333,6 +380,10 @@ if __name__ == '__main__':
                         type=str, default="")
     parser.add_argument('--seed', nargs='?',
                         type=int, default=25072014)
+    # By default, constants.SUMMARY_WARMUP, but at most
+    # constants.SUMMARY_WARMUP_FRACTION of the simulationDuration
+    parser.add_argument('--summaryWarmup', nargs='?',
+                        type=float, default=None)
     parser.add_argument('--simulationDuration', nargs='?',
                         type=int, default=500)
     parser.add_argument('--numRequests', nargs='?',
@@ -353,6 +404,32 @@ if __name__ == '__main__':
                         type=float, default=0.0)
     parser.add_argument('--timeVaryingDrift', nargs='?',
                         type=float, default=0.0)
-    args = parser.parse_args()
+    # Runs need no SimPy processes, and the plain event loop is faster
+    parser.add_argument('--kernel', nargs='?',
+                        choices=sorted(kernel.BACKENDS), default="heapq")
+    parser.add_argument('--monitorSink', nargs='?',
+                        choices=monitors.SINKS, default="stream")
+    parser.add_argument('--monitorFormat', nargs='?',
+                        choices=monitors.FORMATS, default="text")
+    parser.add_argument('--windowSize', nargs='?',
+                        type=float, default=1000.0)
+    parser.add_argument('--instrumentation', nargs='?',
+                        choices=monitors.LEVELS, default="full")
+    parser.add_argument('--sampleEvery', nargs='?',
+                        type=int, default=100)
+    return parser
 
-    runExperiment(args)
+
+def config(**overrides):
+    """The configuration of an experiment: the command line defaults,
+       with overrides, for calling runExperiment() as a library"""
+    args = argumentParser().parse_args([])
+    for name, value in overrides.iteritems():
+        if (not hasattr(args, name)):
+            raise ValueError("Unknown experiment parameter: %s" % name)
+        setattr(args, name, value)
+    return args
+
+
+if __name__ == '__main__':
+    runExperiment(argumentParser().parse_args())
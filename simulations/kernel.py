@@ -0,0 +1,128 @@
+"""
+    The event kernel the simulation runs on. Model code only needs
+    the current time and callbacks fired after a delay (monitors.py
+    keeps the measurements, reading the time off kernel.now()):
+
+        kernel.initialize("heapq")
+        kernel.schedule(delay, callback, *args)
+        kernel.now()
+        kernel.simulate(until=...)
+
+    The "simpy" backend runs on SimPy.Simulation, so SimPy processes
+    (e.g. the observers in our tests) can run alongside the model.
+    The "heapq" backend is a plain event loop that does nothing else.
+"""
+import SimPy.Simulation as Simulation
+from heapq import heappush, heappop
+
+
+class Timer(Simulation.Process):
+    """Fires plain callbacks at scheduled simulation times.
+
+       A single long-lived process drains a heap of (time, callback)
+       entries, so short-lived per-message work (network delivery,
+       service completion, response book-keeping) does not need a
+       process and a generator of its own."""
+    def __init__(self, name="Timer"):
+        self.events = []
+        self.counter = 0
+        self.wakeupTime = None    # None while the timer is idle
+        self.firing = False
+        self.started = False
+        Simulation.Process.__init__(self, name=name)
+
+    def schedule(self, delay, callback, *args):
+        when = Simulation.now() + delay
+        self.counter += 1
+        heappush(self.events, (when, self.counter, callback, args))
+
+        # While firing, the run loop picks up the new entry itself.
+        if (self.firing):
+            return
+        if (self.wakeupTime is None or when < self.wakeupTime):
+            self.wakeupTime = when
+            if (not self.started):
+                self.started = True
+                Simulation.activate(self, self.run(), at=when)
+            else:
+                Simulation.reactivate(self, at=when)
+
+    def run(self):
+        events = self.events
+        while(1):
+            self.firing = True
+            wakeupTime = self.wakeupTime
+            while (len(events) != 0 and events[0][0] <= wakeupTime):
+                when, counter, callback, args = heappop(events)
+                callback(*args)
+            self.firing = False
+
+            if (len(events) != 0):
+                self.wakeupTime = events[0][0]
+                yield Simulation.hold, self, \
+                    max(0.0, self.wakeupTime - Simulation.now())
+            else:
+                self.wakeupTime = None
+                yield Simulation.passivate, self
+
+
+class SimPyKernel():
+    """Callbacks fire from a Timer process on SimPy's global simulation"""
+    def __init__(self):
+        Simulation.initialize()
+        self.timer = Timer()
+        self.now = Simulation.now
+        self.schedule = self.timer.schedule
+
+    def simulate(self, until):
+        return Simulation.simulate(until=until)
+
+
+class HeapqKernel():
+    """A minimal event loop over a heap of (time, callback) entries.
+       Ties fire in the order they were scheduled."""
+    def __init__(self):
+        self.events = []
+        self.counter = 0
+        self.time = 0.0
+
+    def now(self):
+        return self.time
+
+    def schedule(self, delay, callback, *args):
+        self.counter += 1
+        heappush(self.events, (self.time + delay, self.counter,
+                               callback, args))
+
+    def simulate(self, until):
+        events = self.events
+        while (len(events) != 0 and events[0][0] <= until):
+            self.time, counter, callback, args = heappop(events)
+            callback(*args)
+        if (len(events) != 0):
+            self.time = until
+
+
+BACKENDS = {"simpy": SimPyKernel,
+            "heapq": HeapqKernel}
+
+_kernel = None
+
+# Until a backend is initialized, time is SimPy's
+now = Simulation.now
+schedule = None
+
+
+def initialize(backend="simpy"):
+    global _kernel, now, schedule
+    if (backend not in BACKENDS):
+        raise ValueError("Unknown kernel backend: %s" % backend)
+    _kernel = BACKENDS[backend]()
+
+    # Bound directly, as these two sit on every hot path
+    now = _kernel.now
+    schedule = _kernel.schedule
+
+
+def simulate(until):
+    return _kernel.simulate(until)
@@ -0,0 +1,77 @@
+"""
+    A key space with a YCSB-style popularity distribution. Keys are
+    hashed onto the ring and mapped to partitions through the replica
+    placement. Requests only need to know a partition, so the key
+    popularities are summed per partition into one alias table, built
+    once per run. Partitions are then drawn in NumPy batches.
+"""
+import numpy
+import sampler
+
+DISTRIBUTIONS = ("uniform", "zipfian", "hotspot", "latest")
+
+
+def keyPositions(numKeys):
+    """Ring positions, in [0, 1), of keys 0..numKeys-1"""
+    return hashPositions(numpy.arange(numKeys))
+
+
+def hashPositions(keys):
+    """Ring positions, in [0, 1), of integer keys, from a splitmix64
+       hash of the key"""
+    with numpy.errstate(over="ignore"):
+        h = numpy.asarray(keys).astype(numpy.uint64) \
+            + numpy.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+        h = h ^ (h >> numpy.uint64(31))
+    return (h >> numpy.uint64(11)).astype(float) / float(2 ** 53)
+
+
+def keyWeights(numKeys, distribution, zipfExponent=0.99,
+               hotspotFraction=0.2, hotspotOpFraction=0.8):
+    """Relative popularity of keys 0..numKeys-1"""
+    if (distribution == "uniform"):
+        return numpy.ones(numKeys)
+    elif (distribution == "zipfian"):
+        # Key k is the (k + 1)th most popular
+        return 1.0 / numpy.arange(1, numKeys + 1) ** zipfExponent
+    elif (distribution == "latest"):
+        # Without inserts, a zipfian over recency: the key inserted
+        # last, numKeys - 1, is the most popular
+        return 1.0 / numpy.arange(numKeys, 0, -1) ** zipfExponent
+    elif (distribution == "hotspot"):
+        # The first hotspotFraction of the keys get hotspotOpFraction
+        # of the requests
+        numHotKeys = max(1, int(hotspotFraction * numKeys))
+        weights = numpy.empty(numKeys)
+        weights[:numHotKeys] = hotspotOpFraction / numHotKeys
+        if (numHotKeys < numKeys):
+            weights[numHotKeys:] = (1 - hotspotOpFraction) \
+                / (numKeys - numHotKeys)
+        return weights
+    raise ValueError("Unknown key distribution: %s" % distribution)
+
+
+class KeySpace(object):
+    def __init__(self, name, placement, distribution, numKeys=100000,
+                 zipfExponent=0.99, hotspotFraction=0.2,
+                 hotspotOpFraction=0.8):
+        self.placement = placement
+        self.numKeys = numKeys
+        self.distribution = distribution
+        self.keyPartition = \
+            placement.partitionsForPositions(keyPositions(numKeys))
+        weights = keyWeights(numKeys, distribution, zipfExponent,
+                             hotspotFraction, hotspotOpFraction)
+        self.partitionWeights = \
+            numpy.bincount(self.keyPartition, weights=weights,
+                           minlength=len(placement.replicaSets))
+        self.partitionSampler = \
+            sampler.weightedIndex(name, self.partitionWeights)
+
+    def nextPartition(self):
+        return self.partitionSampler.next()
+
+    def nextReplicaSet(self):
+        return self.placement.replicaSets[self.partitionSampler.next()]
@@ -0,0 +1,553 @@
+"""
+    Time series recorded during a run. Every series is written to its
+    own file, <logFolder>/<expPrefix>_<series>, one line per
+    observation: "<owner> <time> <values...>". Observations are kept
+    as tuples of numbers (and client ids), and are only formatted as
+    text when they are written out.
+
+    With the "memory" sink, observations are kept in memory and
+    written out at the end of the run, as they always were. With
+    the "stream" sink, they are written out in chunks as the
+    simulation runs, so memory stays bounded however long the run.
+
+        monitors.initialize("stream", logFolder, expPrefix)
+        m = monitors.Monitor("Latency", owner)
+        m.observe(latency, clientId)
+        monitors.close()
+
+    With the "binary" file format, each series is instead a directory,
+    <expPrefix>_<series>.columns, holding one .npy file per column and
+    a header.json describing them. Owners and client ids are stored as
+    codes into the label lists in the header. load() memory-maps it.
+
+    The *Windows series summarise another series online, per windowSize
+    ms of simulated time: each row is the count, p50, p99 and max of the
+    observations in the window starting at its time. QueueWindows
+    summarises a level instead, the length of a server's wait queue:
+    its count is the number of changes, and its quantiles weight each
+    length by how long it held. Windows without changes get a row for
+    the length carried over into them.
+
+    How much is recorded is set by the instrumentation level. Latency,
+    the result of a run, is always recorded. Beyond it, "off" records
+    nothing, "summary" only the *Windows series, "sampled" also 1 in
+    sampleEvery observations of every other series, and "full"
+    everything. Call sites that do work just to build an observation
+    check the monitor's recording flag first.
+"""
+import json
+import os
+import kernel
+import numpy
+import sketch
+
+SERIES = ("PendingRequests", "LatencyTracker", "Rate", "Tokens",
+          "ReceiveRate", "EdScore", "WaitMon", "ActMon", "serverRR",
+          "Latency", "LatencyWindows", "QueueWindows", "RateWindows")
+
+# Recorded at every instrumentation level
+RESULT_SERIES = ("Latency",)
+
+WINDOW_COLUMNS = (("count", "<i4"), ("p50", "<f8"), ("p99", "<f8"),
+                  ("max", "<f8"))
+
+# The values of an observation of each series, and how they are
+# stored in binary files. "label" columns hold ids, which are stored as
+# codes into a list of labels.
+COLUMNS = {
+    "PendingRequests": (("server", "<i4"), ("pending", "<i4")),
+    "LatencyTracker": (("server", "<i4"), ("latency", "<f8")),
+    "Rate": (("server", "<i4"), ("rate", "<f8")),
+    "Tokens": (("server", "<i4"), ("tokens", "<f8")),
+    "ReceiveRate": (("server", "<i4"), ("rate", "<f8")),
+    "EdScore": (("server", "<i4"), ("queueSizeAfter", "<f8"),
+                ("serviceTime", "<f8"), ("theta", "<f8"),
+                ("score", "<f8")),
+    "WaitMon": (("queue", "<i4"),),
+    "ActMon": (("active", "<i4"),),
+    "serverRR": (("requests", "<i4"),),
+    "Latency": (("latency", "<f8"), ("client", "label")),
+    # Latencies seen by a client, lengths of a server's wait queue
+    # weighted by time, and a client's rate limiter rates by server
+    "LatencyWindows": WINDOW_COLUMNS,
+    "QueueWindows": WINDOW_COLUMNS,
+    "RateWindows": (("server", "<i4"),) + WINDOW_COLUMNS,
+}
+
+# Series whose first value is a quantity rather than an id, and whose
+# monitors keep its mean()
+MEAN_SERIES = ("WaitMon", "ActMon", "serverRR", "Latency")
+
+# Every observation also has an owner and a time
+KEY_COLUMNS = (("owner", "label"), ("time", "<f8"))
+
+# Bytes reserved for the header of a column's .npy file, so that it can
+# be filled in once the number of rows is known
+NPY_HEADER_SIZE = 128
+# Relative log folders are under the top of the repository, next to
+# simulations/, wherever the run is started from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SINKS = ("memory", "stream")
+LEVELS = ("off", "summary", "sampled", "full")
+FORMATS = ("text", "binary")
+
+# Observations buffered per series before they are written out
+FLUSH_EVERY = 8192
+
+
+def textFormat(series):
+    """Format of a line of series, for a (owner, time) + values tuple"""
+    return " ".join(["%s"] * (len(KEY_COLUMNS) + len(COLUMNS[series]))) \
+        + "\n"
+
+
+class TextSink(object):
+    """Buffers the observations of one series and appends them to
+       its file"""
+    def __init__(self, path, series):
+        self.fd = open(path, 'w')
+        self.format = textFormat(series)
+        self.buffer = []
+
+    def write(self, row):
+        self.buffer.append(row)
+        if (len(self.buffer) >= FLUSH_EVERY):
+            self.flush()
+
+    def writeRows(self, rows):
+        self.buffer.extend(rows)
+        self.flush()
+
+    def flush(self):
+        self.fd.write("".join([self.format % row for row in self.buffer]))
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        self.fd.close()
+
+
+def npyHeader(dtype, length):
+    """The header of a 1-d .npy file, padded to NPY_HEADER_SIZE bytes"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" \
+        % (numpy.lib.format.dtype_to_descr(numpy.dtype(dtype)), length)
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return numpy.lib.format.magic(1, 0) \
+        + numpy.array(len(header), "<u2").tostring() + header
+
+
+class BinarySink(object):
+    """Buffers the observations of one series and appends each column
+       to its own .npy file"""
+    def __init__(self, path, series):
+        if (not os.path.isdir(path)):
+            os.mkdir(path)
+        self.path = path
+        self.series = series
+        self.columns = KEY_COLUMNS + COLUMNS[series]
+        self.labels = [{} for column in self.columns]
+        self.fds = []
+        for name, dtype in self.columns:
+            fd = open(os.path.join(path, name + ".npy"), 'wb')
+            fd.write(npyHeader(self.storedType(dtype), 0))
+            self.fds.append(fd)
+        self.length = 0
+        self.buffer = []
+
+    @staticmethod
+    def storedType(dtype):
+        return "<i4" if dtype == "label" else dtype
+
+    def write(self, row):
+        self.buffer.append(row)
+        if (len(self.buffer) >= FLUSH_EVERY):
+            self.flush()
+
+    def writeRows(self, rows):
+        self.buffer.extend(rows)
+        self.flush()
+
+    def flush(self):
+        if (len(self.buffer) == 0):
+            return
+        for i, values in enumerate(zip(*self.buffer)):
+            name, dtype = self.columns[i]
+            if (dtype == "label"):
+                labels = self.labels[i]
+                values = [labels.setdefault(value, len(labels))
+                          for value in values]
+            numpy.array(values, self.storedType(dtype)).tofile(self.fds[i])
+        self.length += len(self.buffer)
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        for (name, dtype), fd in zip(self.columns, self.fds):
+            fd.seek(0)
+            fd.write(npyHeader(self.storedType(dtype), self.length))
+            fd.close()
+        header = {"series": self.series,
+                  "length": self.length,
+                  "columns": [[name, dtype] for name, dtype in self.columns],
+                  "labels": dict((name, sorted(labels, key=labels.get))
+                                 for (name, dtype), labels
+                                 in zip(self.columns, self.labels)
+                                 if dtype == "label")}
+        with open(os.path.join(self.path, "header.json"), 'w') as fd:
+            json.dump(header, fd, indent=1)
+
+
+class Columns(dict):
+    """The columns of a series in binary format, by name. Label columns
+       hold codes; decode() maps them back to ids."""
+    def __init__(self, path):
+        dict.__init__(self)
+        with open(os.path.join(path, "header.json")) as fd:
+            self.header = json.load(fd)
+        self.labels = self.header["labels"]
+        # Empty files cannot be mapped
+        mmapMode = "r" if self.header["length"] > 0 else None
+        for name, dtype in self.header["columns"]:
+            self[name] = numpy.load(os.path.join(path, name + ".npy"),
+                                    mmap_mode=mmapMode)
+
+    def decode(self, name):
+        return numpy.array(self.labels[name], dtype=object)\
+            .take(self[name])
+
+
+def load(path):
+    """Memory-maps a series written in binary format"""
+    return Columns(path)
+
+
+class MemoryMonitor(list):
+    """Keeps an (owner, time) + values tuple for every observation.
+       mean() averages the first value, of series in MEAN_SERIES."""
+    recording = True
+
+    def __init__(self, owner, averaged=True):
+        list.__init__(self)
+        self.owner = owner
+        self.averaged = averaged
+
+    def observe(self, *values):
+        self.append((self.owner, kernel.now()) + values)
+
+    def record(self, t, *values):
+        self.append((self.owner, t) + values)
+
+    def mean(self):
+        if (not self.averaged):
+            raise ValueError("The first value of this series is not a "
+                             "quantity to average")
+        return sum([row[2] for row in self]) / float(len(self))
+
+
+class StreamingMonitor(object):
+    """Hands observations straight to a sink. Keeps only a count."""
+    recording = True
+
+    def __init__(self, sink, owner):
+        self.sink = sink
+        # Observations go straight into the sink's buffer, which it
+        # empties in place when it flushes
+        self.buffer = sink.buffer
+        self.owner = owner
+        self.count = 0
+
+    def observe(self, *values):
+        buffer = self.buffer
+        buffer.append((self.owner, kernel.now()) + values)
+        if (len(buffer) >= FLUSH_EVERY):
+            self.sink.flush()
+        self.count += 1
+
+    def record(self, t, *values):
+        self.sink.write((self.owner, t) + values)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def mean(self):
+        raise ValueError("The first value of this series is not a "
+                         "quantity to average")
+
+
+class AveragingMonitor(StreamingMonitor):
+    """A StreamingMonitor of a series in MEAN_SERIES, which also keeps
+       the running total of the first value, for mean()"""
+    def __init__(self, sink, owner):
+        StreamingMonitor.__init__(self, sink, owner)
+        self.total = 0.0
+
+    def observe(self, *values):
+        StreamingMonitor.observe(self, *values)
+        self.total += values[0]
+
+    def record(self, t, *values):
+        StreamingMonitor.record(self, t, *values)
+        self.total += values[0]
+
+    def mean(self):
+        return self.total / self.count
+
+
+class NullMonitor(object):
+    """For series that are not being recorded"""
+    recording = False
+
+    def observe(self, *values):
+        pass
+
+    def record(self, t, *values):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class SampledMonitor(object):
+    """Passes 1 in every sampleEvery observations on to monitor"""
+    recording = True
+
+    def __init__(self, monitor, sampleEvery):
+        self.monitor = monitor
+        self.sampleEvery = sampleEvery
+        self.skip = 1
+
+    def observe(self, *values):
+        self.skip -= 1
+        if (self.skip == 0):
+            self.skip = self.sampleEvery
+            self.monitor.observe(*values)
+
+    def __len__(self):
+        return len(self.monitor)
+
+    def mean(self):
+        return self.monitor.mean()
+
+
+class WindowedMonitor(object):
+    """Sketches the observations of each key in the current window, and
+       records their summaries to monitor once the window has passed.
+       observe(*key, value)."""
+    recording = True
+
+    def __init__(self, monitor, windowSize):
+        self.monitor = monitor
+        self.windowSize = windowSize
+        self.windowStart = 0.0
+        self.windowEnd = windowSize
+        self.sketches = {}
+
+    def observe(self, *values):
+        now = kernel.now()
+        if (now >= self.windowEnd):
+            self.flush()
+            self.windowStart = now - now % self.windowSize
+            self.windowEnd = self.windowStart + self.windowSize
+        key = values[:-1]
+        s = self.sketches.get(key)
+        if (s is None):
+            s = self.sketches[key] = sketch.QuantileSketch()
+        s.add(values[-1])
+
+    def flush(self):
+        for key in sorted(self.sketches):
+            s = self.sketches[key]
+            self.monitor.record(self.windowStart, *(key + (
+                s.count, s.quantile(0.5), s.quantile(0.99), s.max)))
+        self.sketches = {}
+
+
+class TimeWeightedMonitor(object):
+    """Summarises a level that holds from one observation to the next
+       to monitor, per window: the number of changes, and the p50, p99
+       and max of the level over the window, weighted by how long it
+       held. observe(value)."""
+    recording = True
+
+    def __init__(self, monitor, windowSize):
+        self.monitor = monitor
+        self.windowSize = windowSize
+        self.window = 0
+        self.level = None
+        self.since = 0.0
+        # Time held by each level in the current window
+        self.durations = {}
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        self.advance(kernel.now())
+        self.level = value
+        self.count += 1
+        if (self.max is None or value > self.max):
+            self.max = value
+
+    def advance(self, now):
+        """Accrues the current level's time up to now, recording every
+           window that ends by then"""
+        windowEnd = (self.window + 1) * self.windowSize
+        while (now >= windowEnd):
+            self.hold(windowEnd)
+            self.recordWindow()
+            self.window += 1
+            windowEnd = (self.window + 1) * self.windowSize
+        self.hold(now)
+
+    def hold(self, t):
+        if (self.level is not None and t > self.since):
+            self.durations[self.level] = \
+                self.durations.get(self.level, 0.0) + t - self.since
+        self.since = t
+
+    def quantile(self, q):
+        """The least level held for more than a fraction q of the
+           window's time"""
+        total = sum(self.durations.values())
+        held = 0.0
+        for level in sorted(self.durations):
+            held += self.durations[level]
+            if (held > q * total):
+                return level
+        return level
+
+    def recordWindow(self):
+        if (len(self.durations) != 0):
+            self.monitor.record(self.window * self.windowSize, self.count,
+                                self.quantile(0.5), self.quantile(0.99),
+                                self.max)
+        self.durations = {}
+        self.count = 0
+        self.max = self.level
+
+    def flush(self):
+        self.advance(kernel.now())
+        self.recordWindow()
+
+
+_sink = None
+_fileFormat = "text"
+_logDir = None
+_expPrefix = None
+_series = SERIES
+_windowSize = 0
+_level = "full"
+_sampleEvery = 1
+_sinks = {}
+_monitors = []
+_windowed = []
+
+
+def initialize(sink, logFolder, expPrefix, series=SERIES,
+               fileFormat="text", windowSize=1000.0, level="full",
+               sampleEvery=100):
+    """windowSize is in ms, and 0 turns the *Windows series off"""
+    global _sink, _fileFormat, _logDir, _expPrefix, _series, _sinks
+    global _monitors, _windowSize, _windowed, _level, _sampleEvery
+    if (sink not in SINKS):
+        raise ValueError("Unknown monitor sink: %s" % sink)
+    if (fileFormat not in FORMATS):
+        raise ValueError("Unknown monitor file format: %s" % fileFormat)
+    if (level not in LEVELS):
+        raise ValueError("Unknown instrumentation level: %s" % level)
+    _sink = sink
+    _fileFormat = fileFormat
+    _logDir = os.path.join(ROOT, logFolder)
+    _expPrefix = expPrefix
+    _series = series
+    _windowSize = windowSize
+    _level = level
+    _sampleEvery = sampleEvery
+    if (windowSize <= 0 or level == "off"):
+        _series = [s for s in _series if not s.endswith("Windows")]
+    if (level in ("off", "summary")):
+        _series = [s for s in _series
+                   if s in RESULT_SERIES or s.endswith("Windows")]
+    _sinks = {}
+    _monitors = []
+    _windowed = []
+
+
+def filePath(name):
+    """Path of the run's output file name"""
+    return os.path.join(_logDir, "%s_%s" % (_expPrefix, name))
+
+
+def path(series):
+    if (_fileFormat == "binary"):
+        return filePath(series + ".columns")
+    return filePath(series)
+
+
+def openSink(series):
+    if (_fileFormat == "binary"):
+        return BinarySink(path(series), series)
+    return TextSink(path(series), series)
+
+
+def Monitor(series, owner):
+    """A monitor for owner's observations of series. Its observe()
+       takes the values listed in COLUMNS[series]."""
+    averaged = series in MEAN_SERIES
+    if (_sink is None):
+        # Not recording to files, e.g. in tests
+        return MemoryMonitor(owner, averaged)
+    if (series not in _series):
+        return NullMonitor()
+    if (_sink == "memory"):
+        monitor = MemoryMonitor(owner, averaged)
+        _monitors.append((series, monitor))
+    else:
+        if (series not in _sinks):
+            _sinks[series] = openSink(series)
+        if (averaged):
+            monitor = AveragingMonitor(_sinks[series], owner)
+        else:
+            monitor = StreamingMonitor(_sinks[series], owner)
+    if (_level == "sampled" and series not in RESULT_SERIES
+            and not series.endswith("Windows")):
+        return SampledMonitor(monitor, _sampleEvery)
+    return monitor
+
+
+def Windowed(series, owner):
+    """A WindowedMonitor for owner's summaries of series, or a
+       NullMonitor if windows are not being recorded"""
+    if (_sink is None or series not in _series):
+        return NullMonitor()
+    monitor = WindowedMonitor(Monitor(series, owner), _windowSize)
+    _windowed.append(monitor)
+    return monitor
+
+
+def TimeWeighted(series, owner):
+    """A TimeWeightedMonitor for owner's summaries of series, or a
+       NullMonitor if windows are not being recorded"""
+    if (_sink is None or series not in _series):
+        return NullMonitor()
+    monitor = TimeWeightedMonitor(Monitor(series, owner), _windowSize)
+    _windowed.append(monitor)
+    return monitor
+
+
+def close():
+    """Writes out whatever is still held in memory. Every series
+       recorded gets a file, even without observations."""
+    global _sink
+    for monitor in _windowed:
+        monitor.flush()
+    for series in _series:
+        if (series not in _sinks):
+            _sinks[series] = openSink(series)
+    if (_sink == "memory"):
+        for series, monitor in _monitors:
+            _sinks[series].writeRows(monitor)
+    for sink in _sinks.values():
+        sink.close()
+    _sink = None
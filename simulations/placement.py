@@ -0,0 +1,90 @@
+"""
+    Replica placement: which servers hold the replicas of each
+    partition. A placement is built once per run and shared by all
+    clients. Its replicaSets are an immutable tuple, with one tuple of
+    servers per partition, so choosing the replicas for a request is
+    just an index.
+"""
+import bisect
+import hashlib
+import numpy
+import random
+
+
+class RingPlacement(object):
+    """Contiguous ring: partition i is held by server i and its
+       next RF - 1 neighbours"""
+    def __init__(self, serverList, replicationFactor):
+        n = len(serverList)
+        self.replicaSets = tuple(tuple(serverList[(i + j) % n]
+                                       for j in range(replicationFactor))
+                                 for i in range(n))
+
+    def randomReplicaSet(self):
+        return self.replicaSets[random.randint(0,
+                                               len(self.replicaSets) - 1)]
+
+    def partitionForPosition(self, position):
+        """The partition a key hashed to position, in [0, 1), lands on"""
+        return int(position * len(self.replicaSets))
+
+    def partitionsForPositions(self, positions):
+        n = len(self.replicaSets)
+        return numpy.minimum((numpy.asarray(positions) * n).astype(int),
+                             n - 1)
+
+
+class VnodePlacement(object):
+    """Consistent hashing with numVnodes tokens per server, in the manner
+       of Cassandra's vnodes and SimpleStrategy. Token t owns the range
+       of the ring up to and including t. Each range is a partition, and
+       it is held by the owner of the token and the owners of the
+       following tokens, skipping servers already in the set, until
+       there are RF replicas."""
+    def __init__(self, serverList, replicationFactor, numVnodes):
+        ring = sorted((self.token(node, v), node)
+                      for node in serverList
+                      for v in range(numVnodes))
+        self.tokens = [token for token, node in ring]
+        owners = [node for token, node in ring]
+        replicationFactor = min(replicationFactor, len(serverList))
+
+        replicaSets = []
+        for k in range(len(ring)):
+            replicaSet = []
+            i = k
+            while (len(replicaSet) < replicationFactor):
+                if (owners[i] not in replicaSet):
+                    replicaSet.append(owners[i])
+                i = (i + 1) % len(ring)
+            replicaSets.append(tuple(replicaSet))
+        self.replicaSets = tuple(replicaSets)
+
+    @staticmethod
+    def token(node, vnode):
+        # Position on the ring, in [0, 1), from a hash of the vnode's name
+        digest = hashlib.md5("%s:%s" % (node.id, vnode)).hexdigest()
+        return int(digest[:13], 16) / float(16 ** 13)
+
+    def randomReplicaSet(self):
+        # Keys hash uniformly onto the ring, so larger ranges see
+        # proportionally more requests
+        return self.replicaSets[self.partitionForPosition(random.random())]
+
+    def partitionForPosition(self, position):
+        """The partition a key hashed to position, in [0, 1), lands on"""
+        return bisect.bisect_left(self.tokens, position) % len(self.tokens)
+
+    def partitionsForPositions(self, positions):
+        return numpy.searchsorted(self.tokens, positions) % len(self.tokens)
+
+
+def build(name, serverList, replicationFactor, numVnodes=256):
+    if (name == "ring"):
+        return RingPlacement(serverList, replicationFactor)
+    elif (name == "vnode"):
+        return VnodePlacement(serverList, replicationFactor, numVnodes)
+    raise ValueError("Unknown placement: %s" % name)
+
+
+PLACEMENTS = ("ring", "vnode")
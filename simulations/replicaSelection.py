@@ -0,0 +1,286 @@
+"""
+    Replica selection strategies. A client picks its strategy once, at
+    construction. select() then orders a replica set by preference for
+    every request, and onResponse() lets the strategy learn from the
+    feedback every response carries back. Strategy specific state
+    lives on the strategy, book-keeping every strategy may use
+    (pending requests, last response times) stays on the client.
+"""
+import array
+import random
+import kernel
+import reservoir
+
+# Server feedback kept per replica, as the columns of
+# ExpectedDelayStrategy.expectedDelay
+EMA_METRICS = ("waitingTime", "serviceTime", "queueSizeBefore",
+               "queueSizeAfter", "responseTime", "nw")
+SERVICE_TIME = EMA_METRICS.index("serviceTime")
+QUEUE_SIZE_AFTER = EMA_METRICS.index("queueSizeAfter")
+NW = EMA_METRICS.index("nw")
+
+
+def sortByScore(replicaSet, scores):
+    # Stable, so ties keep their order in the replica set. Replica sets
+    # are small, so plain Python beats vectorizing over them.
+    return sorted(replicaSet, key=lambda replica: scores[replica.id])
+
+
+class Strategy(object):
+    """Keeps the replica set in its given order and learns nothing"""
+    # Whether select() orders by nothing but the client's feedback
+    # about the replicas (Client.feedbackVersions), deterministically,
+    # so that an order can be reused until that feedback changes
+    cacheable = True
+
+    def __init__(self, client):
+        self.client = client
+
+    def select(self, replicaSet):
+        return list(replicaSet)
+
+    def onResponse(self, replica, feedback):
+        pass
+
+
+class RandomStrategy(Strategy):
+    """Pick a random node for the request.
+       Represents SimpleSnitch + uniform request access.
+       Ignore scores and everything else."""
+    cacheable = False
+
+    def select(self, replicaSet):
+        replicaSet = list(replicaSet)
+        random.shuffle(replicaSet)
+        return replicaSet
+
+
+class PrimaryStrategy(Strategy):
+    """Always the first replica of the set"""
+    pass
+
+
+class PendingStrategy(Strategy):
+    """Sort by number of pending requests"""
+    def select(self, replicaSet):
+        return sortByScore(replicaSet, self.client.pendingRequests)
+
+
+class ResponseTimeStrategy(Strategy):
+    """Sort by response times"""
+    def select(self, replicaSet):
+        return sortByScore(replicaSet, self.client.responseTimes)
+
+
+class PendingXServiceTimeStrategy(Strategy):
+    """Sort by response times * client-local-pending-requests"""
+    def select(self, replicaSet):
+        return sortByScore(replicaSet, self.client.pendingXservice)
+
+
+class ClairvoyantStrategy(Strategy):
+    """Sort by response times * pending-requests, as seen by the servers"""
+    cacheable = False
+
+    def select(self, replicaSet):
+        oracleMap = {replica: (1 + replica.outstanding)
+                     * replica.serviceTime
+                     for replica in replicaSet}
+        replicaSet = list(replicaSet)
+        replicaSet.sort(key=oracleMap.get)
+        return replicaSet
+
+
+class ClairvoyantRemainingWorkStrategy(Strategy):
+    """Sort by when a new request would be done, from the service time
+       the servers still owe to the tasks they hold. A tighter lower
+       bound to compare against than clairvoyant."""
+    cacheable = False
+
+    def select(self, replicaSet):
+        oracleMap = {replica: replica.remainingWork()
+                     / replica.resourceCapacity + replica.serviceTime
+                     for replica in replicaSet}
+        replicaSet = list(replicaSet)
+        replicaSet.sort(key=oracleMap.get)
+        return replicaSet
+
+
+class ExpectedDelayStrategy(Strategy):
+    """Keeps an EMA of the waiting and service times relayed by
+       each server, one array column per metric, indexed by server id"""
+    def __init__(self, client):
+        Strategy.__init__(self, client)
+        numSlots = len(client.pendingRequests)
+        self.expectedDelay = [array.array("d", [0.0]) * numSlots
+                              for metric in EMA_METRICS]
+        self.expectedDelayKnown = array.array("b", [0]) * numSlots
+        self.metricColumns = zip(EMA_METRICS, self.expectedDelay)
+
+    def onResponse(self, replica, feedback):
+        alpha = 0.9
+        i = replica.id
+        if (not self.expectedDelayKnown[i]):
+            for metric, column in self.metricColumns:
+                column[i] = feedback[metric]
+            self.expectedDelayKnown[i] = True
+            return
+
+        for metric, column in self.metricColumns:
+            column[i] = alpha * feedback[metric] + (1 - alpha) * column[i]
+
+
+class WeightedResponseTimeStrategy(ExpectedDelayStrategy):
+    """Weighted random proportional to response times"""
+    cacheable = False
+
+    def select(self, replicaSet):
+        # Replicas without feedback yet have a service time of 0
+        replicaSet = sortByScore(replicaSet,
+                                 self.expectedDelay[SERVICE_TIME])
+        responseTimes = [self.client.responseTimes[replica.id]
+                         for replica in replicaSet]
+        total = sum(responseTimes)
+        selection = random.uniform(0, total)
+        cumSum = 0
+        nodeToSelect = None
+        i = 0
+        if (total != 0):
+            for entry, responseTime in zip(replicaSet, responseTimes):
+                cumSum += responseTime
+                if (selection < cumSum):
+                    nodeToSelect = entry
+                    break
+                i += 1
+            assert nodeToSelect is not None
+
+            replicaSet[0], replicaSet[i] = replicaSet[i], replicaSet[0]
+        return replicaSet
+
+
+class ExpDelayStrategy(ExpectedDelayStrategy):
+    """Sort by the expected delay, from the server feedback and the
+       client's own outstanding requests. EdScore records the scores
+       of every order worked out, not of orders reused from a cache."""
+    def select(self, replicaSet):
+        # Stable, so ties keep their order in the replica set
+        totals = self.computeExpectedDelays(replicaSet)
+        order = sorted(range(len(replicaSet)), key=totals.__getitem__)
+        return [replicaSet[i] for i in order]
+
+    def computeExpectedDelays(self, replicaSet):
+        queueSizesAfter = self.expectedDelay[QUEUE_SIZE_AFTER]
+        serviceTimes = self.expectedDelay[SERVICE_TIME]
+        nws = self.expectedDelay[NW]
+        pendingRequests = self.client.pendingRequests
+        numClients = self.client.numClients
+        edScoreMonitor = self.client.edScoreMonitor
+        totals = []
+        for replica in replicaSet:
+            i = replica.id
+            queueSizeAfter = queueSizesAfter[i]
+            serviceTime = serviceTimes[i]
+            theta = 1 + pendingRequests[i] * numClients + queueSizeAfter
+            # Replicas we have no feedback from yet have all-zero
+            # metrics, and so score 0
+            total = nws[i] + ((theta ** 3) * serviceTime)
+            totals.append(total)
+            if (edScoreMonitor.recording and self.expectedDelayKnown[i]):
+                edScoreMonitor.observe(i, queueSizeAfter, serviceTime,
+                                       theta, total)
+        return totals
+
+
+class DsStrategy(Strategy):
+    """Cassandra's dynamic snitching: replicas are scored periodically
+       by the client's DynamicSnitch, from decaying samples of their
+       latencies"""
+    cacheable = False
+
+    def __init__(self, client):
+        Strategy.__init__(self, client)
+        self.latencyEdma = {node: reservoir.DecayingReservoir(100,
+                                                              0.75,
+                                                              self.clock)
+                            for node in client.serverList}
+        self.dsScores = {node: 0 for node in client.serverList}
+        self.snitch = DynamicSnitch(self, 100)
+        kernel.schedule(self.snitch.SNITCHING_INTERVAL, self.snitch.run)
+
+    def clock(self):
+        '''
+            Convert to seconds, because the reservoirs' alpha of 0.75
+            is Cassandra's, per second.
+        '''
+        return kernel.now()/1000.0
+
+    def select(self, replicaSet):
+        replicaSet = list(replicaSet)
+        firstNode = replicaSet[0]
+        firstNodeScore = self.dsScores[firstNode]
+        badnessThreshold = 0.0
+
+        if (firstNodeScore != 0.0):
+            for node in replicaSet[1:]:
+                newNodeScore = self.dsScores[node]
+                if ((firstNodeScore - newNodeScore)/firstNodeScore
+                   > badnessThreshold):
+                    replicaSet.sort(key=self.dsScores.get)
+        return replicaSet
+
+    def onResponse(self, replica, feedback):
+        self.latencyEdma[replica].update(feedback["responseTime"])
+
+
+class DynamicSnitch():
+    '''
+    Model for Cassandra's native dynamic snitching approach. One per
+    client, scoring all of its replicas every snitchUpdateInterval.
+    '''
+    def __init__(self, strategy, snitchUpdateInterval):
+        self.SNITCHING_INTERVAL = snitchUpdateInterval
+        self.strategy = strategy
+        self.client = strategy.client
+
+    def run(self):
+        kernel.schedule(self.SNITCHING_INTERVAL, self.run)
+
+        # Adaptation of DynamicEndpointSnitch algorithm: each replica's
+        # median latency, relative to the worst one, plus a penalty for
+        # the time since it was last heard from
+        medians = {peer: sample.median()
+                   for peer, sample in self.strategy.latencyEdma.items()}
+        if (len(medians) == 0):  # nothing to see here
+            return
+        maxLatency = max([1.0] + medians.values())
+
+        now = kernel.now()
+        penalties = {}
+        for peer in self.client.serverList:
+            penalties[peer] = min(now - float(self.client.lastSeen[peer.id]),
+                                  self.SNITCHING_INTERVAL)
+        penaltiesGtOne = [penalty for penalty in penalties.values()
+                          if penalty > 1.0]
+        maxPenalty = max(penalties.values()) \
+            if len(penaltiesGtOne) > 0 else 1.0
+
+        for peer, median in medians.iteritems():
+            score = median / float(maxLatency)
+            if (peer in penalties):
+                score += penalties[peer] / float(maxPenalty)
+            else:
+                score += 1
+            assert score >= 0 and score <= 2.0
+            self.strategy.dsScores[peer] = score
+
+
+STRATEGIES = {"random": RandomStrategy,
+              "pending": PendingStrategy,
+              "response_time": ResponseTimeStrategy,
+              "weighted_response_time": WeightedResponseTimeStrategy,
+              "primary": PrimaryStrategy,
+              "pendingXserviceTime": PendingXServiceTimeStrategy,
+              "clairvoyant": ClairvoyantStrategy,
+              "clairvoyantRemainingWork": ClairvoyantRemainingWorkStrategy,
+              "expDelay": ExpDelayStrategy,
+              "ds": DsStrategy}
@@ -0,0 +1,90 @@
+"""
+    Forward-decaying latency reservoirs that keep their values in order,
+    so that a median or any other quantile is read off the reservoir
+    rather than from a sorted snapshot of it.
+
+    DecayingReservoir is Cormode et al.'s forward-decaying priority
+    sample, as in Cassandra's and yunomi's ExponentiallyDecayingSample,
+    and draws the same random numbers. A value observed at t has weight
+    exp(alpha * (t - start)), and the reservoir keeps the size values
+    of highest weight / random(). Priorities are a fixed-size min-heap,
+    so the one to evict is found in O(log n); values are also kept in a
+    sorted list of the same size.
+
+    Weights grow exponentially with time, so start is moved forward,
+    and the priorities scaled down, once alpha * (t - start) reaches
+    RESCALE_EXPONENT. Scaling keeps the heap's order, so a rescale is
+    one pass over the reservoir, every RESCALE_EXPONENT / alpha time
+    units.
+"""
+import bisect
+import heapq
+import math
+import random
+
+# Well below log(sys.float_info.max), about 709
+RESCALE_EXPONENT = 100.0
+
+
+class DecayingReservoir(object):
+    def __init__(self, size, alpha, clock):
+        self.size = size
+        self.alpha = alpha
+        self.clock = clock
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        # (priority, value) pairs, least priority first
+        self.heap = []
+        self.sorted = []
+        self.start = self.clock()
+        self.rescaleAt = self.start + RESCALE_EXPONENT / self.alpha
+
+    def rescale(self, now):
+        factor = math.exp(-self.alpha * (now - self.start))
+        self.heap = [(priority * factor, value)
+                     for priority, value in self.heap]
+        self.start = now
+        self.rescaleAt = now + RESCALE_EXPONENT / self.alpha
+
+    def update(self, value):
+        now = self.clock()
+        if (now >= self.rescaleAt):
+            self.rescale(now)
+        priority = math.exp(self.alpha * (now - self.start)) \
+            / random.random()
+        self.count += 1
+
+        if (len(self.heap) < self.size):
+            heapq.heappush(self.heap, (priority, value))
+        elif (self.heap[0][0] < priority):
+            evicted = heapq.heapreplace(self.heap, (priority, value))[1]
+            del self.sorted[bisect.bisect_left(self.sorted, evicted)]
+        else:
+            return
+        bisect.insort(self.sorted, value)
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def quantile(self, q):
+        """The q-quantile of the values in the reservoir, interpolated
+           as Cassandra's snapshots do, 0 if empty"""
+        n = len(self.sorted)
+        if (n == 0):
+            return 0.0
+        pos = q * (n + 1)
+        if (pos < 1):
+            return self.sorted[0]
+        if (pos >= n):
+            return self.sorted[-1]
+        lower = self.sorted[int(pos) - 1]
+        upper = self.sorted[int(pos)]
+        return lower + (pos - int(pos)) * (upper - lower)
+
+    def percentile(self, p):
+        return self.quantile(p / 100.0)
+
+    def median(self):
+        return self.quantile(0.5)
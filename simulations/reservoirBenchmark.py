@@ -0,0 +1,65 @@
+"""
+    Micro-benchmarks of reservoir.DecayingReservoir against yunomi's
+    ExponentiallyDecayingSample, which it replaces, when yunomi is
+    installed: the cost of an update once the reservoir is full, and of
+    reading its median, in microseconds.
+
+        python reservoirBenchmark.py [numUpdates]
+"""
+import random
+import sys
+import timeit
+import reservoir
+
+try:
+    from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+except ImportError:
+    ExponentiallyDecayingSample = None
+
+SIZE = 100
+ALPHA = 0.75
+
+
+class Clock(object):
+    """Simulated seconds, which updates advance by 1 ms each"""
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def implementations():
+    """(name, constructor, median) of each reservoir to compare"""
+    yield ("native", reservoir.DecayingReservoir,
+           lambda sample: sample.median())
+    if (ExponentiallyDecayingSample is not None):
+        yield ("yunomi", ExponentiallyDecayingSample,
+               lambda sample: sample.get_snapshot().get_median())
+
+
+def benchmark(make, median, numUpdates):
+    clock = Clock()
+    sample = make(SIZE, ALPHA, clock)
+    values = [random.expovariate(0.25) for i in range(numUpdates)]
+    for value in values[:SIZE]:
+        sample.update(value)
+
+    def updates():
+        for value in values:
+            clock.t += 0.001
+            sample.update(value)
+    updateTime = timeit.timeit(updates, number=1) / numUpdates
+    medianTime = min(timeit.repeat(lambda: median(sample), number=1000,
+                                   repeat=3)) / 1000
+    return updateTime, medianTime
+
+
+if __name__ == '__main__':
+    numUpdates = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print "%-8s %12s %12s" % ("", "update (us)", "median (us)")
+    for name, make, median in implementations():
+        random.seed(1)
+        updateTime, medianTime = benchmark(make, median, numUpdates)
+        print "%-8s %12.2f %12.2f" % (name, updateTime * 1e6,
+                                      medianTime * 1e6)
@@ -0,0 +1,104 @@
+"""
+    A content-addressed store of run summaries, so that sweeps can be
+    resumed. A run's key is a hash of every parameter that can change
+    its results, including the seed, of the simulator's source and of
+    the trace a run replays. Parameters that only name or shape its
+    output files are left out.
+    The summary of each completed run is kept as <key>.json.
+"""
+import glob
+import hashlib
+import json
+import os
+
+# Where and how a run's monitors are written, not what they hold
+OUTPUT_PARAMETERS = ("expPrefix", "logFolder", "monitorSink",
+                     "monitorFormat", "windowSize", "instrumentation",
+                     "sampleEvery")
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Traces are hashed this many bytes at a time
+HASH_BLOCK = 1 << 20
+
+_codeVersion = None
+
+# (path, size, mtime) -> hash of a trace's contents
+_traceVersions = {}
+
+
+def codeVersion():
+    """Hash of the simulator's source, so that changing the code
+       invalidates earlier results"""
+    global _codeVersion
+    if (_codeVersion is None):
+        h = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(SOURCE_DIR, "*.py"))):
+            h.update(os.path.basename(path))
+            with open(path) as fd:
+                h.update(fd.read())
+        _codeVersion = h.hexdigest()
+    return _codeVersion
+
+
+def traceVersion(path):
+    """Hash of a trace's contents, so that rewriting a trace in place
+       invalidates the results replayed from it"""
+    stat = os.stat(path)
+    cacheKey = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if (cacheKey not in _traceVersions):
+        h = hashlib.sha1()
+        with open(path, 'rb') as fd:
+            for block in iter(lambda: fd.read(HASH_BLOCK), ""):
+                h.update(block)
+        _traceVersions[cacheKey] = h.hexdigest()
+    return _traceVersions[cacheKey]
+
+
+def parameters(config):
+    return dict((name, value) for name, value in vars(config).iteritems()
+                if name not in OUTPUT_PARAMETERS)
+
+
+def normalize(value):
+    # 4 and 4.0 configure the same run
+    if (isinstance(value, (int, long)) and not isinstance(value, bool)):
+        return float(value)
+    return value
+
+
+def key(config):
+    content = {"parameters": dict((name, normalize(value))
+                                  for name, value
+                                  in parameters(config).iteritems()),
+               "code": codeVersion()}
+    if (config.workloadModel == "trace"):
+        content["trace"] = traceVersion(config.traceFile)
+    return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+
+class ResultStore(object):
+    def __init__(self, path):
+        if (not os.path.isdir(path)):
+            os.makedirs(path)
+        self.path = path
+
+    def entryPath(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def get(self, key):
+        """The summary stored for key, or None"""
+        if (not os.path.exists(self.entryPath(key))):
+            return None
+        with open(self.entryPath(key)) as fd:
+            return json.load(fd)["summary"]
+
+    def put(self, key, config, summary):
+        # Written aside and renamed into place, so that concurrent
+        # workers and interrupted sweeps never leave a partial entry
+        temporary = self.entryPath(key) + ".%s.tmp" % os.getpid()
+        with open(temporary, 'w') as fd:
+            json.dump({"parameters": parameters(config),
+                       "code": codeVersion(),
+                       "summary": summary}, fd, indent=1, sort_keys=True)
+        os.rename(temporary, self.entryPath(key))
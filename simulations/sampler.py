@@ -0,0 +1,98 @@
+"""
+    Random variates for the hot paths (network latency, service times,
+    inter-arrival times) are drawn from NumPy in blocks and handed out
+    one at a time. Every component gets its own named stream, seeded
+    from the run's seed, so a run is reproducible and adding draws to
+    one component does not shift the samples another one sees.
+"""
+import numpy
+import zlib
+
+BLOCK_SIZE = 1024
+
+_seed = 0
+
+
+def initialize(seed):
+    global _seed
+    _seed = seed
+
+
+def stream(name):
+    return numpy.random.RandomState([_seed & 0xffffffff,
+                                     zlib.crc32(name) & 0xffffffff])
+
+
+class BufferedSampler(object):
+    """Hands out samples drawn in blocks by draw(size)"""
+    def __init__(self, draw, blockSize=BLOCK_SIZE):
+        self.draw = draw
+        self.blockSize = blockSize
+        self.block = []
+
+    def next(self):
+        if (len(self.block) == 0):
+            # Reversed, so that pop() hands them out in drawn order
+            self.block = self.draw(self.blockSize)[::-1].tolist()
+        return self.block.pop()
+
+    def take(self, size):
+        """The next size samples, in the order next() would return them"""
+        if (len(self.block) < size):
+            refill = max(self.blockSize, size - len(self.block))
+            self.block = self.draw(refill)[::-1].tolist() + self.block
+        samples = self.block[len(self.block) - size:]
+        del self.block[len(self.block) - size:]
+        samples.reverse()
+        return samples
+
+
+def standardExponential(name):
+    return BufferedSampler(stream(name).standard_exponential)
+
+
+def standardNormal(name):
+    return BufferedSampler(stream(name).standard_normal)
+
+
+def poisson(name, lam):
+    randomState = stream(name)
+    return BufferedSampler(lambda size: randomState.poisson(lam, size))
+
+
+class AliasTable(object):
+    """Walker's alias method: built once in O(n), after which every
+       draw from the discrete distribution given by weights is O(1)"""
+    def __init__(self, weights):
+        n = len(weights)
+        scaled = numpy.asarray(weights, dtype=float)
+        assert n > 0 and scaled.min() >= 0 and scaled.sum() > 0
+        scaled = (scaled * n / scaled.sum()).tolist()
+        self.prob = numpy.ones(n)
+        self.alias = numpy.arange(n)
+
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while (len(small) != 0 and len(large) != 0):
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if (scaled[l] < 1.0):
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left over is 1, up to rounding
+
+    def draw(self, randomState, size):
+        column = randomState.randint(0, len(self.prob), size)
+        keep = randomState.random_sample(size) < self.prob[column]
+        return numpy.where(keep, column, self.alias[column])
+
+
+def weightedIndex(name, weights):
+    """Indices drawn with probability proportional to weights"""
+    table = AliasTable(weights)
+    randomState = stream(name)
+    return BufferedSampler(lambda size: table.draw(randomState, size))
@@ -1,61 +1,131 @@
-import SimPy.Simulation as Simulation
+import kernel
 import math
-import random
+import monitors
+import sampler
 import sys
+from collections import deque
 
 
-class Server():
+class Server(object):
     """A representation of a physical server that holds resources"""
     def __init__(self, id_, resourceCapacity,
                  serviceTime, serviceTimeModel):
         self.id = id_
         self.serviceTime = serviceTime
         self.serviceTimeModel = serviceTimeModel
-        self.queueResource = Simulation.Resource(capacity=resourceCapacity,
-                                                 monitored=True)
-        self.serverRRMonitor = Simulation.Monitor(name="ServerMonitor")
+        self.resourceCapacity = resourceCapacity
+
+        # Tasks currently holding one of the resourceCapacity slots,
+        # and tasks waiting (FIFO) for a free slot, as (task, arrival
+        # time, queue size on arrival, demand) entries.
+        self.activeCount = 0
+        self.waitQ = deque()
+
+        # Oracle counters, kept up to date as tasks arrive, start and
+        # complete: the number of tasks queued or in service, the sum of
+        # the completion times of tasks in service, and the service
+        # demand drawn for queued tasks (in units of serviceTime).
+        self.outstanding = 0
+        self.busyUntil = 0.0
+        self.queuedDemand = 0.0
+        self.actMon = monitors.Monitor("ActMon", id_)
+        self.waitMon = monitors.Monitor("WaitMon", id_)
+        self.actMon.observe(0)
+        self.waitMon.observe(0)
+        self.queueWindows = monitors.TimeWeighted("QueueWindows", id_)
+        self.queueWindows.observe(0)
+
+        self.serverRRMonitor = monitors.Monitor("serverRR", id_)
+        self.serviceTimeSampler = \
+            sampler.standardExponential("service-%s" % id_)
 
     def enqueueTask(self, task):
-        executor = Executor(self, task)
+        """Serves task, or queues it until a slot is free. What the
+           server tracks of a task travels with it, in its wait queue
+           entry and its completion callback."""
+        arrival = kernel.now()
+        queueSizeBefore = len(self.waitQ)
+        if (task.serviceTimeHint is None):
+            demand = self.sampleDemand()
+        else:
+            demand = task.serviceTimeHint / self.serviceTime
+        self.outstanding += 1
         self.serverRRMonitor.observe(1)
-        Simulation.activate(executor, executor.run(), Simulation.now())
+        if (self.activeCount < self.resourceCapacity):
+            self.activeCount += 1
+            self.actMon.observe(self.activeCount)
+            self.startTask(task, arrival, queueSizeBefore, demand)
+        else:
+            self.queuedDemand += demand
+            self.waitQ.append((task, arrival, queueSizeBefore, demand))
+            self.waitMon.observe(len(self.waitQ))
+            self.queueWindows.observe(len(self.waitQ))
+
+    def release(self):
+        self.outstanding -= 1
+        self.activeCount -= 1
+        self.actMon.observe(self.activeCount)
+        if (len(self.waitQ) != 0):
+            entry = self.waitQ.popleft()
+            self.queuedDemand -= entry[3]
+            if (len(self.waitQ) == 0):
+                self.queuedDemand = 0.0     # no rounding drift
+            self.waitMon.observe(len(self.waitQ))
+            self.queueWindows.observe(len(self.waitQ))
+            self.activeCount += 1
+            self.actMon.observe(self.activeCount)
+            self.startTask(*entry)
+
+    # Called once the task holds one of the server's slots
+    def startTask(self, task, arrival, queueSizeBefore, demand):
+        now = kernel.now()
+        if (task.serviceTimeHint is None):
+            serviceTime = self.getServiceTime(demand)  # Mu_i
+        else:
+            serviceTime = task.serviceTimeHint
+        finish = now + serviceTime
+        self.busyUntil += finish
+        kernel.schedule(serviceTime, self.completeTask, task,
+                        now - arrival, serviceTime, finish, queueSizeBefore)
 
-    def getServiceTime(self):
+    def completeTask(self, task, waitTime, serviceTime, finish,
+                     queueSizeBefore):
+        self.busyUntil -= finish
+        if (self.activeCount == 1):
+            self.busyUntil = 0.0      # no rounding drift
+        self.release()
+
+        task.sigTaskComplete({"waitingTime": waitTime,       # W_i
+                              "serviceTime": serviceTime,
+                              "queueSizeBefore": queueSizeBefore,
+                              "queueSizeAfter": len(self.waitQ)})
+
+    def remainingWork(self):
+        """Service time still owed to the tasks at this server: what is
+           left of the tasks in service, plus the demand of the queued
+           ones at the current service time"""
+        return (self.busyUntil - self.activeCount * kernel.now()
+                + self.queuedDemand * self.serviceTime)
+
+    def sampleDemand(self):
+        """A task's service demand, in units of serviceTime. Drawn on
+           arrival, so that the oracle knows it while the task waits."""
+        if (self.serviceTimeModel == "random.expovariate"):
+            return self.serviceTimeSampler.next()
+        return 1.0
+
+    def getServiceTime(self, demand=1.0):
         serviceTime = 0.0
         if (self.serviceTimeModel == "random.expovariate"):
-            serviceTime = random.expovariate(1.0/(self.serviceTime))
+            serviceTime = self.serviceTime * demand
         elif (self.serviceTimeModel == "constant"):
             serviceTime = self.serviceTime
         elif(self.serviceTimeModel == "math.sin"):
             serviceTime = self.serviceTime \
                 + self.serviceTime \
-                * math.sin(1 + Simulation.now()/100)
+                * math.sin(1 + kernel.now()/100)
         else:
             print "Unknown service time model"
             sys.exit(-1)
 
         return serviceTime
-
-
-class Executor(Simulation.Process):
-
-    def __init__(self, server, task):
-        self.server = server
-        self.task = task
-        Simulation.Process.__init__(self, name='Executor')
-
-    def run(self):
-        start = Simulation.now()
-        queueSizeBefore = len(self.server.queueResource.waitQ)
-        yield Simulation.hold, self
-        yield Simulation.request, self, self.server.queueResource
-        waitTime = Simulation.now() - start         # W_i
-        serviceTime = self.server.getServiceTime()  # Mu_i
-        yield Simulation.hold, self, serviceTime
-        yield Simulation.release, self, self.server.queueResource
-
-        queueSizeAfter = len(self.server.queueResource.waitQ)
-        self.task.sigTaskComplete({"waitingTime": waitTime,
-                                   "serviceTime": serviceTime,
-                                   "queueSizeBefore": queueSizeBefore,
-                                   "queueSizeAfter": queueSizeAfter})
@@ -0,0 +1,115 @@
+"""
+    Quantile sketches of latencies, kept online so that tail latencies
+    need neither every sample in memory nor a pass over the latency
+    file afterwards.
+
+    QuantileSketch is a log-bucketed histogram in the manner of
+    DDSketch: a value x lands in bucket ceil(log_gamma(x)), so every
+    quantile is within relativeAccuracy of the true one. Sketches with
+    the same accuracy merge by adding their bucket counts, so a global
+    sketch is just the merge of the per-client ones.
+"""
+import json
+import math
+
+QUANTILES = (0.5, 0.95, 0.99, 0.999)
+
+# The columns of a latency summary as a flat row, see summaryRow()
+SUMMARY_COLUMNS = ("count", "mean", "min", "max", "p50", "p95", "p99",
+                   "p99.9", "range50", "range95", "range99")
+
+
+class QuantileSketch(object):
+    def __init__(self, relativeAccuracy=0.01):
+        self.relativeAccuracy = relativeAccuracy
+        self.gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self.logGamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value):
+        if (value > 0):
+            i = int(math.ceil(math.log(value) / self.logGamma))
+            self.buckets[i] = self.buckets.get(i, 0) + 1
+        else:
+            self.zeros += 1
+        self.count += 1
+        self.total += value
+        if (value < self.min):
+            self.min = value
+        if (value > self.max):
+            self.max = value
+
+    def merge(self, other):
+        assert self.gamma == other.gamma
+        for i, n in other.buckets.iteritems():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        assert self.count > 0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if (seen > rank):
+            return max(self.min, 0.0)
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if (seen > rank):
+                # The middle of bucket i, (gamma^(i-1), gamma^i], in
+                # relative terms
+                estimate = 2 * self.gamma ** i / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count
+
+    def summary(self, quantiles=QUANTILES):
+        if (self.count == 0):
+            return {"count": 0}
+        summary = {"count": self.count,
+                   "mean": self.mean(),
+                   "min": self.min,
+                   "max": self.max}
+        for q in quantiles:
+            summary["p%g" % (q * 100)] = self.quantile(q)
+        return summary
+
+
+def latencySummary(sketches, quantiles=QUANTILES):
+    """Summary of a run from per-client sketches: the quantiles of all
+       requests and of each client's, and for the first three quantiles,
+       the spread between the best and worst client"""
+    merged = QuantileSketch(sketches.values()[0].relativeAccuracy)
+    for s in sketches.values():
+        merged.merge(s)
+    clients = dict((clientId, s.summary(quantiles))
+                   for clientId, s in sketches.iteritems())
+    summary = {"all": merged.summary(quantiles), "clients": clients}
+    for q in quantiles[:3]:
+        key = "p%g" % (q * 100)
+        values = [c[key] for c in clients.values() if c["count"] > 0]
+        if (len(values) > 0):
+            summary["range%g" % (q * 100)] = max(values) - min(values)
+    return summary
+
+
+def summaryRow(summary):
+    """The SUMMARY_COLUMNS of a latencySummary(), None where a column is
+       missing, e.g. the quantiles of a run without requests"""
+    return [summary["all"].get(column, summary.get(column))
+            for column in SUMMARY_COLUMNS]
+
+
+def writeSummary(path, summary):
+    with open(path, 'w') as fd:
+        json.dump(summary, fd, indent=1, sort_keys=True)
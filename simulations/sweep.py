@@ -0,0 +1,62 @@
+"""
+    Sweeps run in-process: each point is a call to
+    factorialExperiment.runExperiment() in one of a pool of long-lived
+    worker processes, so SimPy, numpy and the simulator are imported
+    once per worker rather than once per point.
+
+        configs = [factorialExperiment.config(seed=s, ...) for s in seeds]
+        for summary in sweep.run(configs, numWorkers=8):
+            ...
+
+    Given a resultStore.ResultStore, points already in it are not run
+    again, and the summaries of new ones are added to it.
+"""
+import multiprocessing
+import os
+import sys
+import traceback
+import factorialExperiment
+import resultStore
+
+
+def quiet():
+    # Runs print progress, which would interleave across workers
+    sys.stdout = open(os.devnull, 'w')
+
+
+def runPoint(config, store=None):
+    """The latency summary of one point, or None if the run failed"""
+    if (store is not None):
+        key = resultStore.key(config)
+        summary = store.get(key)
+        if (summary is not None):
+            return summary
+    try:
+        summary = factorialExperiment.runExperiment(config)
+    except Exception:
+        traceback.print_exc()
+        return None
+    if (store is not None):
+        store.put(key, config, summary)
+    return summary
+
+
+def runJob(job):
+    return runPoint(*job)
+
+
+def pool(numWorkers=None):
+    """A pool of numWorkers (by default, one per CPU) quiet workers"""
+    return multiprocessing.Pool(numWorkers, initializer=quiet)
+
+
+def run(configs, numWorkers=None, store=None):
+    """Runs configs concurrently, yielding their summaries in order"""
+    workers = pool(numWorkers)
+    try:
+        for summary in workers.imap(runJob,
+                                    [(config, store) for config in configs]):
+            yield summary
+    finally:
+        workers.terminate()
+        workers.join()
@@ -1,16 +1,26 @@
-import SimPy.Simulation as Simulation
+import kernel
 
+# Priority classes of tasks, served in this order from a backlog
+LATENCY_CRITICAL = 0
+BATCH = 1
 
-class Task():
+
+class Task(object):
     """A simple Task. Applications may subclass this
        for holding specific attributes if need be"""
     def __init__(self, id_, latencyMonitor):
         self.id = id_
-        self.start = Simulation.now()
-        self.completionEvent = Simulation.SimEvent("ClientToServerCompletion")
+        self.start = kernel.now()
+        # Called with the task and the server's feedback once served
+        self.completionHandler = None
+        # The replica the task was sent to
+        self.replica = None
         self.latencyMonitor = latencyMonitor
+        # Service time to use instead of the server's model, if known
+        self.serviceTimeHint = None
+        self.priority = LATENCY_CRITICAL
 
     # Used as a notifier mechanism
     def sigTaskComplete(self, piggyBack=None):
-        if (self.completionEvent is not None):
-            self.completionEvent.signal(piggyBack)
+        if (self.completionHandler is not None):
+            self.completionHandler(self, piggyBack)
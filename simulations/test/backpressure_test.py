@@ -2,6 +2,8 @@ import unittest
 import server
 import client
 import task
+import kernel
+import monitors
 import SimPy.Simulation as Simulation
 
 
@@ -9,7 +11,7 @@ class Observer(Simulation.Process):
     def __init__(self, serverList, client):
         self.serverList = serverList
         self.client = client
-        self.monitor = Simulation.Monitor(name="Latency")
+        self.monitor = monitors.Monitor("Latency", "0")
         Simulation.Process.__init__(self, name='Observer')
 
     def addNtasks(self, cli, N):
@@ -184,6 +186,30 @@ class Observer(Simulation.Process):
         assert rateLimiter1.getTokens() >= 0 and rateLimiter1.getTokens() < 1
         assert rateLimiter2.getTokens() >= 0 and rateLimiter2.getTokens() < 1
 
+    def testRateChangeMovesWakeup(self):
+        yield Simulation.hold, self
+        rateLimiter = self.client.rateLimiters[self.serverList[0]]
+        bps = self.client.backpressureSchedulers[self.serverList[0]]
+
+        rateLimiter.rate = 5
+        rateLimiter.tokens = 0.0
+        rateLimiter.lastSent = Simulation.now()
+        self.addNtasks(self.client, 1)
+        yield Simulation.hold, self, 1.0
+        # One wakeup, for the next token 4ms after the last one
+        assert len(bps.backlogQueue) == 1
+        assert bps.wakeupTime == rateLimiter.lastSent + 4.0
+
+        # Doubling the rate brings the token, and the wakeup, forward.
+        # The stale wakeup later fires to no effect.
+        rateLimiter.setRate(10)
+        assert bps.wakeupTime == rateLimiter.lastSent + 2.0
+        yield Simulation.hold, self, 1.0 + 0.0001
+        assert len(bps.backlogQueue) == 0
+        assert rateLimiter.waiters == [] and bps.wakeupTime is None
+        yield Simulation.hold, self, 3.0
+        assert len(bps.backlogQueue) == 0
+
 
 class TestServerLoop(unittest.TestCase):
 
@@ -191,7 +217,7 @@ class TestServerLoop(unittest.TestCase):
     # by a server, then check for two tasks being executed
     # one after the other.
     def testBackPressureLoopSingleServer1(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         s1 = server.Server(1,
                            resourceCapacity=1,
                            serviceTime=4,
@@ -216,7 +242,7 @@ class TestServerLoop(unittest.TestCase):
         Simulation.simulate(until=100)
 
     def testBackPressureLoopSingleServer2(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         s1 = server.Server(1,
                            resourceCapacity=1,
                            serviceTime=4,
@@ -241,7 +267,7 @@ class TestServerLoop(unittest.TestCase):
         Simulation.simulate(until=100)
 
     def testBackPressureLoopSingleServer3(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         s1 = server.Server(1,
                            resourceCapacity=1,
                            serviceTime=4,
@@ -266,7 +292,7 @@ class TestServerLoop(unittest.TestCase):
         Simulation.simulate(until=100)
 
     def testBackPressureLoopTwoServers(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         s1 = server.Server(1,
                            resourceCapacity=1,
                            serviceTime=4,
@@ -294,6 +320,95 @@ class TestServerLoop(unittest.TestCase):
                             at=0.1)
         Simulation.simulate(until=100)
 
+    def testRateChangeMovesWakeup(self):
+        kernel.initialize("simpy")
+        s1 = server.Server(1,
+                           resourceCapacity=1,
+                           serviceTime=4,
+                           serviceTimeModel="constant")
+        c1 = client.Client(id_="Client1",
+                           serverList=[s1],
+                           replicaSelectionStrategy="expDelay",
+                           accessPattern="uniform",
+                           replicationFactor=1,
+                           backpressure=True,
+                           shadowReadRatio=0.0,
+                           rateInterval=20,
+                           cubicC=0.000004,
+                           cubicSmax=10,
+                           cubicBeta=0.2,
+                           hysterisisFactor=2,
+                           demandWeight=1.0)
+        observer = Observer([s1], c1)
+        Simulation.activate(observer,
+                            observer.testRateChangeMovesWakeup(),
+                            at=0.1)
+        Simulation.simulate(until=100)
+
+
+class BacklogTest(unittest.TestCase):
+
+    def testPriorityClassesInOrder(self):
+        backlog = client.Backlog()
+        backlog.append("batch1", task.BATCH)
+        backlog.append("read1")
+        backlog.append("batch2", task.BATCH)
+        backlog.append("read2", task.LATENCY_CRITICAL)
+        assert len(backlog) == 4 and backlog.head() == "read1"
+        assert [backlog.popleft() for i in range(4)] \
+            == ["read1", "read2", "batch1", "batch2"]
+        assert len(backlog) == 0
+
+    def testSortIsCachedUntilFeedbackChanges(self):
+        kernel.initialize("simpy")
+        servers = [server.Server(i, resourceCapacity=1, serviceTime=4,
+                                 serviceTimeModel="constant")
+                   for i in range(3)]
+        c = client.Client(id_="Client1", serverList=servers,
+                          replicaSelectionStrategy="pending",
+                          accessPattern="uniform", replicationFactor=3,
+                          backpressure=True, shadowReadRatio=0.0,
+                          rateInterval=20, cubicC=0.000004, cubicSmax=10,
+                          cubicBeta=0.2, hysterisisFactor=2,
+                          demandWeight=1.0)
+        bps = c.backpressureSchedulers[servers[0]]
+        first = bps.select(servers)
+        assert bps.select(servers) is first
+        c.pendingRequests[0] = 5
+        c.feedbackVersions[0] += 1
+        assert bps.select(servers) == servers[1:] + servers[:1]
+
+    def testCriticalTaskDoesNotWaitBehindBatch(self):
+        kernel.initialize("heapq")
+        servers = [server.Server(i, resourceCapacity=1, serviceTime=4,
+                                 serviceTimeModel="constant")
+                   for i in range(5)]
+        c = client.Client(id_="Client1", serverList=servers,
+                          replicaSelectionStrategy="primary",
+                          accessPattern="uniform", replicationFactor=2,
+                          backpressure=True, shadowReadRatio=0.0,
+                          rateInterval=20, cubicC=0.000004, cubicSmax=10,
+                          cubicBeta=0.2, hysterisisFactor=2,
+                          demandWeight=1.0)
+        for replica in servers[:2]:
+            c.rateLimiters[replica].tokens = 0
+            c.rateLimiters[replica].rate = 0.01
+        c.rateLimiters[servers[2]].tokens = 10
+        monitor = monitors.Monitor("Latency", "0")
+        batch = task.Task("Batch", monitor)
+        batch.priority = task.BATCH
+        c.schedule(batch, servers[:2])
+        read = task.Task("Read", monitor)
+        kernel.schedule(1.0, c.schedule, read, [servers[0], servers[2]])
+        kernel.simulate(until=1.5)
+        # The read goes out at once, through the replica with tokens,
+        # while the batch task keeps waiting for one at t=2000
+        assert c.taskSentTimeTracker[read] == 1.0
+        bps = c.backpressureSchedulers[servers[0]]
+        assert len(bps.backlogQueue) == 1
+        assert bps.backlogQueue.head()[0] is batch
+        assert bps.wakeupTime == 2000.0
+
 
 if __name__ == '__main__':
     unittest.main()
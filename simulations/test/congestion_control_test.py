@@ -0,0 +1,75 @@
+import unittest
+import client
+import kernel
+import server
+import congestionControl
+
+
+class CongestionControlTest(unittest.TestCase):
+
+    def setUp(self):
+        kernel.initialize("heapq")
+        self.server = server.Server(0, resourceCapacity=1, serviceTime=4,
+                                    serviceTimeModel="constant")
+
+    def makeClient(self, rateController):
+        return client.Client(id_="Client1", serverList=[self.server],
+                             replicaSelectionStrategy="primary",
+                             accessPattern="uniform", replicationFactor=1,
+                             backpressure=True, shadowReadRatio=0.0,
+                             rateInterval=20, cubicC=0.000004, cubicSmax=10,
+                             cubicBeta=0.2, hysterisisFactor=2,
+                             demandWeight=1.0, rateController=rateController)
+
+    def respond(self, c, at, responseTime=4.0, receiveRate=None):
+        """A response at time at, with the receive rate measured then"""
+        def onResponse():
+            if (receiveRate is not None):
+                c.receiveRate[self.server].rate = receiveRate
+                c.receiveRate[self.server].last = int(at / 20)
+            c.updateRates(self.server, {"responseTime": responseTime}, None)
+        kernel.schedule(at - kernel.now(), onResponse)
+        kernel.simulate(until=at)
+        return c.rateLimiters[self.server].rate
+
+    def testChosenOnce(self):
+        for name, controller in congestionControl.CONTROLLERS.items():
+            assert isinstance(self.makeClient(name).controller, controller)
+        self.assertRaises(ValueError, self.makeClient, "reno")
+
+    def testAimd(self):
+        c = self.makeClient("aimd")
+        assert self.respond(c, 20.0, receiveRate=10) == 6
+        # At most one increase per rateInterval
+        assert self.respond(c, 30.0, receiveRate=10) == 6
+        assert self.respond(c, 40.0, receiveRate=10) == 7
+        # and a decrease only after rateInterval * hysterisisFactor
+        assert self.respond(c, 60.0, receiveRate=1) == 7
+        assert abs(self.respond(c, 81.0, receiveRate=1) - 1.4) < 1e-9
+
+    def testVegas(self):
+        c = self.makeClient("vegas")
+        # Response times at their least, so nothing is queued
+        assert self.respond(c, 20.0, responseTime=4.0) == 6
+        assert self.respond(c, 40.0, responseTime=4.0) == 7
+        # Response times grow, so requests queue up at the replica
+        for t in range(41, 60):
+            self.respond(c, float(t), responseTime=68.0)
+        assert self.respond(c, 60.0, responseTime=68.0) == 6
+
+    def testBbr(self):
+        c = self.makeClient("bbr")
+        rates = [self.respond(c, t * 20.0, receiveRate=10)
+                 for t in range(1, 6)]
+        # Startup, until the receive rate stops growing...
+        assert rates[:4] == [10 * congestionControl.STARTUP_GAIN] * 4
+        # ... then cycling through the probe gains, by interval
+        assert rates[4] == 10 * congestionControl.PROBE_GAINS[5]
+        assert self.respond(c, 160.0, receiveRate=10) == 10 * 1.25
+        # The bandwidth estimate is the largest recent receive rate,
+        # 10 rather than 5
+        assert self.respond(c, 180.0, receiveRate=5) == 10 * 0.75
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import random
+import numpy
+import kernel
+import server
+import client
+import workload
+import monitors
+
+
+class KernelTest(unittest.TestCase):
+
+    def recordTrace(self, backend):
+        kernel.initialize(backend)
+        trace = []
+
+        def record(tag):
+            trace.append((kernel.now(), tag))
+
+        def recordAndReschedule(tag):
+            record(tag)
+            kernel.schedule(0, record, tag + "-nested")
+            kernel.schedule(1.5, record, tag + "-later")
+
+        kernel.schedule(2.0, record, "c")
+        kernel.schedule(1.0, recordAndReschedule, "a")
+        kernel.schedule(1.0, record, "b")
+        kernel.schedule(50.0, record, "too-late")
+        kernel.simulate(until=10)
+        return trace
+
+    def testCallbackOrder(self):
+        expected = [(1.0, "a"), (1.0, "b"), (1.0, "a-nested"),
+                    (2.0, "c"), (2.5, "a-later")]
+        for backend in kernel.BACKENDS:
+            trace = self.recordTrace(backend)
+            assert trace == expected, (backend, trace)
+            assert kernel.now() == 10, (backend, kernel.now())
+
+    def runScenario(self, backend):
+        random.seed(1)
+        numpy.random.seed(1)
+        kernel.initialize(backend)
+        servers = [server.Server(i,
+                                 resourceCapacity=2,
+                                 serviceTime=4,
+                                 serviceTimeModel="constant")
+                   for i in range(3)]
+        c1 = client.Client(id_="Client1",
+                           serverList=servers,
+                           replicaSelectionStrategy="pending",
+                           accessPattern="uniform",
+                           replicationFactor=2,
+                           backpressure=True,
+                           shadowReadRatio=0.1,
+                           rateInterval=20,
+                           cubicC=0.000004,
+                           cubicSmax=10,
+                           cubicBeta=0.2,
+                           hysterisisFactor=2,
+                           demandWeight=1.0)
+        latencyMonitor = monitors.Monitor("Latency", "0")
+        w = workload.Workload(1, latencyMonitor, [c1],
+                              "constant", 0.5, 200)
+        kernel.schedule(0.0, w.run)
+        kernel.simulate(until=1000)
+        return list(latencyMonitor)
+
+    def testBackendsAgree(self):
+        simpyLatencies = self.runScenario("simpy")
+        heapqLatencies = self.runScenario("heapq")
+        assert len(simpyLatencies) == 200
+        assert simpyLatencies == heapqLatencies
+
+
+if __name__ == '__main__':
+    unittest.main()
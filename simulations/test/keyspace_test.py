@@ -0,0 +1,51 @@
+import unittest
+import numpy
+import keyspace
+import placement
+import sampler
+
+
+class Node(object):
+    def __init__(self, id_):
+        self.id = id_
+
+
+class KeySpaceTest(unittest.TestCase):
+
+    def setUp(self):
+        sampler.initialize(7)
+        self.servers = [Node(i) for i in range(10)]
+
+    def testKeyPositions(self):
+        positions = keyspace.keyPositions(100000)
+        assert positions.min() >= 0.0 and positions.max() < 1.0
+        assert abs(positions.mean() - 0.5) < 0.01
+        # A key's position does not depend on the size of the key space
+        assert (keyspace.keyPositions(10) == positions[:10]).all()
+
+    def testWeights(self):
+        zipfian = keyspace.keyWeights(1000, "zipfian")
+        latest = keyspace.keyWeights(1000, "latest")
+        assert zipfian.argmax() == 0 and latest.argmax() == 999
+        hotspot = keyspace.keyWeights(1000, "hotspot",
+                                      hotspotFraction=0.1,
+                                      hotspotOpFraction=0.9)
+        assert abs(hotspot[:100].sum() / hotspot.sum() - 0.9) < 1e-9
+        self.assertRaises(ValueError, keyspace.keyWeights, 10, "normal")
+
+    def testPartitionsFollowKeys(self):
+        p = placement.VnodePlacement(self.servers, 3, 8)
+        ks = keyspace.KeySpace("keys", p, "hotspot", numKeys=1000,
+                               hotspotFraction=0.01,
+                               hotspotOpFraction=1.0)
+        # Every request goes to a partition holding one of the hot keys
+        hotPartitions = set(ks.keyPartition[:10].tolist())
+        for i in range(1000):
+            assert ks.nextPartition() in hotPartitions
+        assert ks.nextReplicaSet() in [p.replicaSets[k]
+                                       for k in hotPartitions]
+        assert numpy.isclose(ks.partitionWeights.sum(), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import kernel
+import monitors
+
+
+class MonitorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logs = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.logs)
+
+    def logPath(self, name):
+        return os.path.join(self.logs, name)
+
+    def record(self, sink):
+        kernel.initialize("heapq")
+        monitors.initialize(sink, self.logs, sink,
+                            series=["Latency", "Rate"])
+        latency = monitors.Monitor("Latency", "0")
+        rates = [monitors.Monitor("Rate", "Client%s" % i) for i in range(2)]
+        ignored = monitors.Monitor("Tokens", "Client0")
+        for i in range(10):
+            kernel.schedule(i, latency.observe, i * 2, "Client1")
+            kernel.schedule(i, rates[i % 2].observe, i, 0.5)
+            kernel.schedule(i, ignored.observe, i, 1)
+        kernel.simulate(until=100)
+        assert len(latency) == 10 and len(ignored) == 0
+        assert latency.mean() == 9.0
+        # The first value of a Rate observation is a server id
+        self.assertRaises(ValueError, rates[0].mean)
+        monitors.close()
+        return [open(self.logPath("%s_%s" % (sink, series))).read()
+                for series in ["Latency", "Rate"]]
+
+    def testStreamMatchesMemory(self):
+        monitors.FLUSH_EVERY = 3
+        try:
+            memory = self.record("memory")
+            stream = self.record("stream")
+        finally:
+            monitors.FLUSH_EVERY = 8192
+        assert memory[0] == stream[0]
+        assert memory[0].splitlines()[1] == "0 1.0 2 Client1"
+        assert memory[1].splitlines()[1] == "Client0 2.0 2 0.5"
+        # Streamed lines are in time order rather than grouped by owner
+        assert sorted(memory[1].splitlines()) \
+            == sorted(stream[1].splitlines())
+        assert not os.path.exists(self.logPath("memory_Tokens"))
+
+    def testBinaryColumns(self):
+        monitors.FLUSH_EVERY = 3
+        try:
+            for sink in monitors.SINKS:
+                kernel.initialize("heapq")
+                monitors.initialize(sink, self.logs, sink,
+                                    fileFormat="binary")
+                latency = monitors.Monitor("Latency", "0")
+                for i in range(10):
+                    kernel.schedule(i, latency.observe, i * 2.0,
+                                    "Client%s" % (i % 3))
+                kernel.simulate(until=100)
+                monitors.close()
+                columns = monitors.load(
+                    self.logPath("%s_Latency.columns" % sink))
+                assert isinstance(columns["latency"], numpy.memmap)
+                assert columns["latency"].tolist() \
+                    == [i * 2.0 for i in range(10)]
+                assert columns["time"].tolist() == range(10)
+                assert columns.decode("client").tolist() \
+                    == ["Client%s" % (i % 3) for i in range(10)]
+                assert columns.decode("owner").tolist() == ["0"] * 10
+                # Series without observations still load
+                assert len(monitors.load(
+                    self.logPath("%s_WaitMon.columns" % sink))["queue"]) == 0
+        finally:
+            monitors.FLUSH_EVERY = 8192
+
+    def testWindows(self):
+        kernel.initialize("heapq")
+        monitors.initialize("stream", self.logs, "w", windowSize=10.0)
+        rates = monitors.Windowed("RateWindows", "Client0")
+        for i in range(25):
+            kernel.schedule(i, rates.observe, i % 2, float(i))
+        kernel.simulate(until=100)
+        monitors.close()
+        rows = [line.split()
+                for line in open(self.logPath("w_RateWindows"))]
+        assert [row[1:4] for row in rows] \
+            == [["0.0", "0", "5"], ["0.0", "1", "5"],
+                ["10.0", "0", "5"], ["10.0", "1", "5"],
+                ["20.0", "0", "3"], ["20.0", "1", "2"]]
+        # max is exact, quantiles are within the sketch's accuracy
+        assert rows[3][6] == "19.0"
+        assert abs(float(rows[2][4]) - 14.0) < 0.15
+
+        monitors.initialize("stream", self.logs, "off", windowSize=0)
+        assert isinstance(monitors.Windowed("RateWindows", "Client0"),
+                          monitors.NullMonitor)
+        monitors.close()
+        assert not os.path.exists(self.logPath("off_RateWindows"))
+
+    def testQueueWindowsWeighByTime(self):
+        kernel.initialize("heapq")
+        monitors.initialize("stream", self.logs, "q", windowSize=10.0)
+        queue = monitors.TimeWeighted("QueueWindows", 0)
+        # A short burst in a mostly empty window, then a steady queue
+        # that outlasts the windows it changed in
+        for t, length in [(0, 0), (1, 5), (2, 0), (12, 3)]:
+            kernel.schedule(t, queue.observe, length)
+        # A pending event, so that the run lasts until 35
+        kernel.schedule(50, queue.observe, 0)
+        kernel.simulate(until=35)
+        monitors.close()
+        rows = [line.split()[1:]
+                for line in open(self.logPath("q_QueueWindows"))]
+        assert rows == [["0.0", "3", "0", "5", "5"],
+                        ["10.0", "1", "3", "3", "3"],
+                        ["20.0", "0", "3", "3", "3"],
+                        ["30.0", "0", "3", "3", "3"]]
+
+    def testLevels(self):
+        kernel.initialize("heapq")
+        monitors.initialize("stream", self.logs, "s", level="sampled",
+                            sampleEvery=4)
+        tokens = monitors.Monitor("Tokens", "Client0")
+        latency = monitors.Monitor("Latency", "0")
+        for i in range(10):
+            kernel.schedule(i, tokens.observe, 0, float(i))
+            kernel.schedule(i, latency.observe, float(i), "Client0")
+        kernel.simulate(until=100)
+        monitors.close()
+        assert len(tokens) == 3 and len(latency) == 10
+        tokens = [line.split()[3]
+                  for line in open(self.logPath("s_Tokens"))]
+        assert tokens == ["0.0", "4.0", "8.0"]
+
+        for level in ["off", "summary"]:
+            monitors.initialize("stream", self.logs, level, level=level)
+            assert not monitors.Monitor("Tokens", "Client0").recording
+            assert monitors.Monitor("Latency", "0").recording
+            windows = monitors.Windowed("QueueWindows", 0)
+            assert windows.recording == (level == "summary")
+            monitors.close()
+
+    def testUnknownSink(self):
+        self.assertRaises(ValueError, monitors.initialize, "tape",
+                          self.logs, "x")
+        self.assertRaises(ValueError, monitors.initialize, "stream",
+                          self.logs, "x", fileFormat="tape")
+        self.assertRaises(ValueError, monitors.initialize, "stream",
+                          self.logs, "x", level="verbose")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import placement
+
+
+class Node(object):
+    def __init__(self, id_):
+        self.id = id_
+
+
+class PlacementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = [Node(i) for i in range(5)]
+
+    def testRing(self):
+        p = placement.RingPlacement(self.servers, 3)
+        s = self.servers
+        assert len(p.replicaSets) == 5
+        assert p.replicaSets[0] == (s[0], s[1], s[2])
+        assert p.replicaSets[4] == (s[4], s[0], s[1])
+        assert p.replicaSets[p.partitionForPosition(0.99)] \
+            == p.replicaSets[4]
+
+    def testVnodes(self):
+        p = placement.VnodePlacement(self.servers, 3, 64)
+        assert len(p.replicaSets) == 5 * 64
+        assert p.tokens == sorted(p.tokens)
+        for replicaSet in p.replicaSets:
+            assert len(set(replicaSet)) == 3
+
+        # Token t owns the range up to and including t
+        first = p.tokens[0]
+        assert p.partitionForPosition(first) == 0
+        assert p.partitionForPosition(first / 2.0) == 0
+        assert p.partitionForPosition(p.tokens[-1] + 1e-12) == 0
+        assert p.partitionForPosition(first + 1e-12) == 1
+
+        # Every server is primary for about its share of the ring
+        share = dict((node, 0.0) for node in self.servers)
+        previous = p.tokens[-1] - 1.0
+        for token, replicaSet in zip(p.tokens, p.replicaSets):
+            share[replicaSet[0]] += token - previous
+            previous = token
+        assert abs(sum(share.values()) - 1.0) < 1e-9
+        for node in self.servers:
+            assert 0.15 < share[node] < 0.25
+
+    def testBuild(self):
+        assert isinstance(placement.build("vnode", self.servers, 2, 4),
+                          placement.VnodePlacement)
+        self.assertRaises(ValueError, placement.build, "mesh",
+                          self.servers, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import client
+import kernel
 import SimPy.Simulation as Simulation
 
 
@@ -105,19 +106,19 @@ class Observer(Simulation.Process):
 class RateLimiterTest(unittest.TestCase):
 
     def testRateLimiter1(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         observer = Observer()
         Simulation.activate(observer, observer.test1(), at=0.1)
         Simulation.simulate(until=200)
 
     def testRateLimiter2(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         observer = Observer()
         Simulation.activate(observer, observer.test2(), at=0.1)
         Simulation.simulate(until=200)
 
     def testRateLimiter3(self):
-        Simulation.initialize()
+        kernel.initialize("simpy")
         observer = Observer()
         Simulation.activate(observer, observer.test3(), at=0.1)
         Simulation.simulate(until=200)
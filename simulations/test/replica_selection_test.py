@@ -0,0 +1,89 @@
+import unittest
+import kernel
+import server
+import client
+import task
+import replicaSelection
+
+
+class ReplicaSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        kernel.initialize("simpy")
+        self.servers = [server.Server(i,
+                                      resourceCapacity=1,
+                                      serviceTime=4,
+                                      serviceTimeModel="constant")
+                        for i in range(3)]
+
+    def makeClient(self, strategy):
+        return client.Client(id_="Client1",
+                             serverList=self.servers,
+                             replicaSelectionStrategy=strategy,
+                             accessPattern="uniform",
+                             replicationFactor=3,
+                             backpressure=False,
+                             shadowReadRatio=0.0,
+                             rateInterval=20,
+                             cubicC=0.000004,
+                             cubicSmax=10,
+                             cubicBeta=0.2,
+                             hysterisisFactor=2,
+                             demandWeight=1.0)
+
+    def testStrategyIsChosenOnce(self):
+        c = self.makeClient("pending")
+        assert isinstance(c.strategy, replicaSelection.PendingStrategy)
+        self.assertRaises(ValueError, self.makeClient, "unknown")
+
+    def testPendingIsStable(self):
+        c = self.makeClient("pending")
+        c.pendingRequests[0] = 2
+        c.pendingRequests[1] = 1
+        c.pendingRequests[2] = 1
+        s0, s1, s2 = self.servers
+        assert c.strategy.select([s0, s1, s2]) == [s1, s2, s0]
+        assert c.strategy.select([s2, s0, s1]) == [s2, s1, s0]
+
+    def testExpDelayLearnsFromResponses(self):
+        c = self.makeClient("expDelay")
+        s0, s1, s2 = self.servers
+        feedback = {"waitingTime": 0.0, "serviceTime": 4.0,
+                    "queueSizeBefore": 0, "queueSizeAfter": 0,
+                    "responseTime": 6.0, "nw": 2.0}
+        c.strategy.onResponse(s0, feedback)
+        # Replicas with no feedback yet are tried first
+        assert c.strategy.select([s0, s1, s2]) == [s1, s2, s0]
+
+        slower = dict(feedback, serviceTime=8.0)
+        c.strategy.onResponse(s1, slower)
+        c.strategy.onResponse(s2, feedback)
+        assert c.strategy.select([s1, s2, s0]) == [s2, s0, s1]
+
+    def runOracleScenario(self, until):
+        s0, s1, s2 = self.servers
+        # Two tasks on s0: one in service from t=0, one queued behind it
+        kernel.schedule(0.0, s0.enqueueTask, task.Task("A", None))
+        kernel.schedule(0.0, s0.enqueueTask, task.Task("B", None))
+        kernel.schedule(1.0, s1.enqueueTask, task.Task("C", None))
+        kernel.simulate(until=until)
+
+    def testOracleCounters(self):
+        c = self.makeClient("clairvoyantRemainingWork")
+        s0, s1, s2 = self.servers
+        self.runOracleScenario(3.0)
+        assert s0.outstanding == 2 and s1.outstanding == 1
+        assert s2.outstanding == 0
+        assert s0.remainingWork() == 1.0 + 4.0
+        assert s1.remainingWork() == 2.0
+        assert s2.remainingWork() == 0.0
+        assert c.strategy.select([s0, s1, s2]) == [s2, s1, s0]
+
+    def testOracleCountersDrain(self):
+        self.runOracleScenario(20.0)
+        for s in self.servers:
+            assert s.outstanding == 0 and s.remainingWork() == 0.0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+import reservoir
+
+
+class ReservoirTest(unittest.TestCase):
+
+    def fill(self, size, times):
+        now = [0.0]
+        sample = reservoir.DecayingReservoir(size, 0.75, lambda: now[0])
+        random.seed(5)
+        for i, t in enumerate(times):
+            now[0] = t
+            sample.update(float(i))
+        return sample
+
+    def testQuantiles(self):
+        sample = self.fill(10, [0.0] * 4)
+        assert sample.sorted == [0.0, 1.0, 2.0, 3.0]
+        assert sample.median() == 1.5
+        assert sample.quantile(0.1) == 0.0
+        assert sample.percentile(99) == 3.0
+        assert sample.quantile(0.7) == 2.5
+        assert reservoir.DecayingReservoir(10, 0.75, lambda: 0).median() \
+            == 0.0
+
+    def testFavoursRecentValues(self):
+        sample = self.fill(100, [i * 0.01 for i in range(5000)])
+        assert len(sample) == 100
+        assert sorted(value for priority, value in sample.heap) \
+            == sample.sorted
+        # Weights double every second, so nearly all of the reservoir
+        # was observed within its last few seconds
+        assert sample.quantile(0.1) > 4000
+
+    def testRescaleKeepsSample(self):
+        # Far past where exp(alpha * t) overflows without rescaling
+        times = [i * 1.0 for i in range(2000)]
+        rescaled = self.fill(50, times)
+        assert rescaled.start > 1800
+        original = reservoir.RESCALE_EXPONENT
+        reservoir.RESCALE_EXPONENT = 1.0
+        try:
+            often = self.fill(50, times)
+        finally:
+            reservoir.RESCALE_EXPONENT = original
+        assert often.sorted == rescaled.sorted
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+import factorialExperiment
+import resultStore
+import sweep
+import workload
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = resultStore.ResultStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testKey(self):
+        config = factorialExperiment.config(seed=1, intervalParam=10)
+        key = resultStore.key(config)
+        # Output files do not matter, parameters do
+        renamed = factorialExperiment.config(seed=1, intervalParam=10,
+                                             expPrefix="other",
+                                             logFolder="elsewhere")
+        assert resultStore.key(renamed) == key
+        assert resultStore.key(factorialExperiment.config(
+            seed=2, intervalParam=10)) != key
+        assert resultStore.key(factorialExperiment.config(
+            seed=1, intervalParam=50)) != key
+        # Numbers are compared by value
+        assert resultStore.key(factorialExperiment.config(
+            seed=1, intervalParam=10.0)) == key
+
+    def testTraceContentsAreKeyed(self):
+        path = os.path.join(self.path, "trace")
+        workload.writeTrace(path, [0.5, 2.0], [0, 1], [3, 0])
+        config = factorialExperiment.config(workloadModel="trace",
+                                            traceFile=path)
+        key = resultStore.key(config)
+        assert resultStore.key(config) == key
+        workload.writeTrace(path, [0.5, 2.5], [0, 1], [3, 0])
+        # Same size, other contents (and a distinct mtime, should the
+        # file system's timestamps be coarse)
+        os.utime(path, (0, 0))
+        assert resultStore.key(config) != key
+
+    def testStoredPointsAreSkipped(self):
+        # Nothing could run with this scenario, so the summary must come
+        # from the store
+        config = factorialExperiment.config(expScenario="unknown")
+        assert self.store.get(resultStore.key(config)) is None
+        self.store.put(resultStore.key(config), config, {"all": {"count": 1}})
+        assert sweep.runPoint(config, self.store) == {"all": {"count": 1}}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import numpy
+import sampler
+
+
+class SamplerTest(unittest.TestCase):
+
+    def testBlocksMatchSingleDraw(self):
+        # Samples handed out across several refills are exactly the
+        # stream's own draws, in order
+        sampler.initialize(7)
+        s = sampler.BufferedSampler(sampler.stream("a").standard_normal,
+                                    blockSize=10)
+        samples = [s.next() for i in range(35)]
+        sampler.initialize(7)
+        expected = sampler.stream("a").standard_normal(40)[:35].tolist()
+        assert samples == expected
+
+    def testTakeMatchesNext(self):
+        sampler.initialize(7)
+        s = sampler.BufferedSampler(sampler.stream("a").standard_normal,
+                                    blockSize=10)
+        samples = [s.next() for i in range(3)] + s.take(25) + [s.next()]
+        sampler.initialize(7)
+        s = sampler.BufferedSampler(sampler.stream("a").standard_normal,
+                                    blockSize=10)
+        assert samples == [s.next() for i in range(29)]
+
+    def testStreamsAreReproducibleAndIndependent(self):
+        sampler.initialize(7)
+        a = sampler.standardExponential("a")
+        b = sampler.standardExponential("b")
+        firstA = [a.next() for i in range(5)]
+        firstB = [b.next() for i in range(5)]
+        assert firstA != firstB
+
+        # Drawing from b first must not change what a hands out
+        sampler.initialize(7)
+        b = sampler.standardExponential("b")
+        a = sampler.standardExponential("a")
+        assert [b.next() for i in range(5)] == firstB
+        assert [a.next() for i in range(5)] == firstA
+
+        sampler.initialize(8)
+        a = sampler.standardExponential("a")
+        assert [a.next() for i in range(5)] != firstA
+
+    def testPoisson(self):
+        sampler.initialize(7)
+        p = sampler.poisson("w", 4.0)
+        samples = [p.next() for i in range(5000)]
+        assert all(isinstance(x, int) for x in samples)
+        assert abs(numpy.mean(samples) - 4.0) < 0.2
+
+    def testAliasTable(self):
+        sampler.initialize(7)
+        weights = [1, 2, 3, 0, 4]
+        s = sampler.weightedIndex("w", weights)
+        counts = numpy.bincount([s.next() for i in range(100000)],
+                                minlength=5) / 100000.0
+        assert counts[3] == 0
+        for count, weight in zip(counts, weights):
+            assert abs(count - weight / 10.0) < 0.01
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import numpy
+import sketch
+
+
+class SketchTest(unittest.TestCase):
+
+    def testQuantilesWithinAccuracy(self):
+        values = numpy.random.RandomState(3).exponential(5.0, 100000)
+        s = sketch.QuantileSketch(0.01)
+        for v in values.tolist():
+            s.add(v)
+        assert s.count == len(values)
+        assert s.min == values.min() and s.max == values.max()
+        for q in sketch.QUANTILES:
+            exact = numpy.percentile(values, q * 100)
+            assert abs(s.quantile(q) - exact) / exact < 0.02, q
+
+    def testMergeMatchesSingleSketch(self):
+        values = numpy.random.RandomState(4).lognormal(1.0, 1.0, 5000)
+        whole = sketch.QuantileSketch()
+        parts = [sketch.QuantileSketch() for i in range(3)]
+        for i, v in enumerate(values.tolist()):
+            whole.add(v)
+            parts[i % 3].add(v)
+        merged = sketch.QuantileSketch()
+        for part in parts:
+            merged.merge(part)
+        assert merged.buckets == whole.buckets
+        assert merged.count == whole.count
+        for q in sketch.QUANTILES:
+            assert merged.quantile(q) == whole.quantile(q)
+
+    def testLatencySummary(self):
+        fast, slow = sketch.QuantileSketch(), sketch.QuantileSketch()
+        for i in range(100):
+            fast.add(1.0)
+            slow.add(10.0)
+        idle = sketch.QuantileSketch()
+        summary = sketch.latencySummary({"Client0": fast, "Client1": slow,
+                                         "Client2": idle})
+        assert summary["all"]["count"] == 200
+        assert summary["clients"]["Client2"] == {"count": 0}
+        assert abs(summary["range50"] - 9.0) < 0.2
+        assert abs(summary["clients"]["Client1"]["p99"] - 10.0) < 0.1
+        row = dict(zip(sketch.SUMMARY_COLUMNS, sketch.summaryRow(summary)))
+        assert row["count"] == 200 and row["range50"] == summary["range50"]
+
+        empty = sketch.latencySummary({"Client0": idle})
+        assert sketch.summaryRow(empty)[:2] == [0, None]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import kernel
+import placement
+import sampler
+import workload
+
+
+class FakeClient(object):
+    def __init__(self, id_, demandWeight):
+        self.id = id_
+        self.demandWeight = demandWeight
+        self.scheduled = []
+
+    def schedule(self, task, replicaSet=None):
+        self.scheduled.append((kernel.now(), task.serviceTimeHint,
+                               replicaSet))
+
+
+class WorkloadTest(unittest.TestCase):
+
+    def setUp(self):
+        sampler.initialize(7)
+        kernel.initialize("heapq")
+
+    def testWeightedChoiceFollowsDemandWeights(self):
+        # As in experiment.py: a tenth of the clients issue half the load
+        clients = [FakeClient(i, 5.0) for i in range(2)] + \
+                  [FakeClient(i, 0.5555) for i in range(2, 20)]
+        w = workload.Workload(1, None, clients, "constant", 1, 0)
+        chosen = [w.weightedChoice() for i in range(20000)] + \
+            w.weightedChoices(20000)
+        heavy = sum(1 for c in chosen if c.id < 2) / float(len(chosen))
+        assert abs(heavy - 0.5) < 0.01
+
+    def testUpdateDemandWeights(self):
+        clients = [FakeClient(0, 1.0), FakeClient(1, 1.0)]
+        w = workload.Workload(1, None, clients, "constant", 1, 0)
+        clients[0].demandWeight = 0.0
+        w.updateDemandWeights()
+        assert w.total == 1.0
+        assert set(w.weightedChoices(100)) == set([clients[1]])
+
+    def testTraceReplay(self):
+        servers = [FakeClient(i, 0) for i in range(4)]
+        ring = placement.RingPlacement(servers, 2)
+        clients = [FakeClient(0, 1.0), FakeClient(1, 1.0)]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            workload.writeTrace(path, [0.5, 2.0, 2.0, 7.25],
+                                [0, 1, 0, 1], [3, 0, 1, 6],
+                                [0.0, 3.5, 0.0, 0.0])
+            trace = workload.openTrace(path)
+            w = workload.Workload(1, None, clients, "trace", 0, 3,
+                                  trace=trace, placement=ring,
+                                  traceKeys=False)
+            kernel.schedule(0.0, w.run)
+            kernel.simulate(until=100)
+
+            # Client ids index the client list
+            w = workload.Workload(2, None, clients[:1], "trace", 0, 3,
+                                  trace=trace, placement=ring,
+                                  traceKeys=False)
+            self.assertRaises(ValueError, w.run)
+            del trace, w
+        finally:
+            os.remove(path)
+
+        # Only numRequests are replayed
+        assert clients[0].scheduled == [(0.5, None, ring.replicaSets[3]),
+                                        (2.0, None, ring.replicaSets[1])]
+        assert clients[1].scheduled == [(2.0, 3.5, ring.replicaSets[0])]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,56 +1,170 @@
-import SimPy.Simulation as Simulation
-import random
-import task
+import kernel
 import numpy
+import task
+import sampler
+import keyspace
+
+# A trace is a flat file of these records, in arrival order. Times are
+# in ms since the start of the trace, which is replayed from time 0.
+# key is a key, hashed onto the ring, or with traceKeys=False a
+# partition index. A serviceTime <= 0 means no hint, so the server
+# draws one from its model.
+TRACE_DTYPE = numpy.dtype([("time", "<f8"),
+                           ("client", "<i4"),
+                           ("key", "<i8"),
+                           ("serviceTime", "<f4")])
+TRACE_CHUNK = 4096
+
+
+def openTrace(path):
+    """Memory-maps a trace, a .npy file or raw TRACE_DTYPE records, so
+       that only the part being replayed is ever in memory"""
+    if (path.endswith(".npy")):
+        trace = numpy.load(path, mmap_mode="r")
+    else:
+        trace = numpy.memmap(path, dtype=TRACE_DTYPE, mode="r")
+    assert trace.dtype.names == TRACE_DTYPE.names
+    return trace
+
+
+def writeTrace(path, times, clients, keys, serviceTimes=None):
+    records = numpy.zeros(len(times), dtype=TRACE_DTYPE)
+    records["time"] = times
+    records["client"] = clients
+    records["key"] = keys
+    if (serviceTimes is not None):
+        records["serviceTime"] = serviceTimes
+    records.tofile(path)
 
 
-class Workload(Simulation.Process):
+class Workload():
 
     def __init__(self, id_, latencyMonitor, clientList,
-                 model, model_param, numRequests):
+                 model, model_param, numRequests,
+                 trace=None, placement=None, traceKeys=True,
+                 batchFraction=0.0):
+        self.id = id_
         self.latencyMonitor = latencyMonitor
         self.clientList = clientList
         self.model = model
         self.model_param = model_param
         self.numRequests = numRequests
-        self.total = sum(client.demandWeight for client in self.clientList)
-        Simulation.Process.__init__(self, name='Workload' + str(id_))
+        self.taskCounter = 0
+        # Tasks are batch reads with this probability, else latency
+        # critical ones
+        self.batchFraction = batchFraction
+        if (batchFraction > 0):
+            self.batchSampler = sampler.BufferedSampler(
+                sampler.stream("batch-%s" % id_).random_sample)
+        self.clientStream = sampler.stream("clients-%s" % id_)
+        self.updateDemandWeights()
+        if (self.model == "poisson"):
+            self.arrivalSampler = sampler.poisson("workload-%s" % id_,
+                                                  model_param)
+        elif (self.model == "trace"):
+            self.trace = trace
+            self.placement = placement
+            self.traceKeys = traceKeys
+            self.tracePosition = 0
+            self.records = []
+            self.nextRecord = None
 
     # TODO: also need non-uniform client access
     # Need to pin workload to a client
     def run(self):
+        if (self.model == "trace"):
+            self.replay()
+            return
+        if (self.numRequests == 0):
+            return
+
+        taskToSchedule = self.newTask()
 
-        taskCounter = 0
+        # Push out a task...
+        clientNode = self.weightedChoice()
 
-        while(self.numRequests != 0):
-            yield Simulation.hold, self,
+        clientNode.schedule(taskToSchedule)
 
-            taskToSchedule = task.Task("Task" + str(taskCounter),
-                                       self.latencyMonitor)
-            taskCounter += 1
+        self.numRequests -= 1
 
-            # Push out a task...
-            clientNode = self.weightedChoice()
+        # Simulate client delay
+        if (self.model == "poisson"):
+            kernel.schedule(self.arrivalSampler.next(), self.run)
 
-            clientNode.schedule(taskToSchedule)
+        # If model is gaussian, add gaussian delay
+        # If model is constant, add fixed delay
+        elif (self.model == "constant"):
+            kernel.schedule(self.model_param, self.run)
 
-            # Simulate client delay
-            if (self.model == "poisson"):
-                yield Simulation.hold, self,\
-                    numpy.random.poisson(self.model_param)
+        else:
+            kernel.schedule(0, self.run)
 
-            # If model is gaussian, add gaussian delay
-            # If model is constant, add fixed delay
-            if (self.model == "constant"):
-                yield Simulation.hold, self, self.model_param
+    def newTask(self):
+        newTask = task.Task("Task" + str(self.taskCounter),
+                            self.latencyMonitor)
+        self.taskCounter += 1
+        if (self.batchFraction > 0
+                and self.batchSampler.next() < self.batchFraction):
+            newTask.priority = task.BATCH
+        return newTask
 
+    def replay(self):
+        # Issue the record that is due, then wait for the next one
+        if (self.nextRecord is not None):
+            time, clientId, partition, serviceTime = self.nextRecord
+            taskToSchedule = self.newTask()
+            if (serviceTime > 0):
+                taskToSchedule.serviceTimeHint = serviceTime
+            clientNode = self.clientList[clientId]
+            clientNode.schedule(taskToSchedule,
+                                self.placement.replicaSets[partition])
             self.numRequests -= 1
 
+        self.nextRecord = self.readRecord()
+        if (self.numRequests == 0 or self.nextRecord is None):
+            return
+        kernel.schedule(max(0.0, self.nextRecord[0] - kernel.now()),
+                        self.replay)
+
+    def readRecord(self):
+        if (len(self.records) == 0):
+            chunk = self.trace[self.tracePosition:
+                               self.tracePosition + TRACE_CHUNK]
+            if (len(chunk) == 0):
+                return None
+            # Client ids index clientList
+            clientIds = chunk["client"]
+            badIds = clientIds[(clientIds < 0)
+                               | (clientIds >= len(self.clientList))]
+            if (len(badIds) != 0):
+                raise ValueError("Trace client id %d out of range for %d "
+                                 "clients" % (badIds[0],
+                                              len(self.clientList)))
+            self.tracePosition += len(chunk)
+            if (self.traceKeys):
+                partitions = self.placement.partitionsForPositions(
+                    keyspace.hashPositions(chunk["key"]))
+            else:
+                partitions = chunk["key"] % len(self.placement.replicaSets)
+            # Reversed, so that pop() hands them out in trace order
+            self.records = zip(chunk["time"].tolist(),
+                               chunk["client"].tolist(),
+                               partitions.tolist(),
+                               chunk["serviceTime"].tolist())[::-1]
+        return self.records.pop()
+
+    def updateDemandWeights(self):
+        """Must be called whenever clientList or a client's
+           demandWeight changes"""
+        self.total = sum(client.demandWeight for client in self.clientList)
+        table = sampler.AliasTable([client.demandWeight
+                                    for client in self.clientList])
+        self.clientSampler = sampler.BufferedSampler(
+            lambda size: table.draw(self.clientStream, size))
+
     def weightedChoice(self):
-        r = random.uniform(0, self.total)
-        upto = 0
-        for client in self.clientList:
-            if upto + client.demandWeight > r:
-                return client
-            upto += client.demandWeight
-        assert False, "Shouldn't get here"
+        # A client, with probability proportional to its demandWeight
+        return self.clientList[self.clientSampler.next()]
+
+    def weightedChoices(self, size):
+        return [self.clientList[i] for i in self.clientSampler.take(size)]